@@ -6,10 +6,34 @@ from dataclasses import dataclass
 class AppConfig:
     output_dir: str
     log_file: str
+    journal_file: str
     host: str
     port: int
     auth_user: str | None
     auth_pass: str | None
+    log_flush_seconds: float
+    log_flush_bytes: int
+    stop_grace_seconds: float
+    stall_seconds: float
+    stall_restart: bool
+    input_buffer_mb: int
+    capture_cpus: str
+    capture_nice: str
+    capture_ionice: str
+    background_cpus: str
+    background_nice: str
+    background_ionice: str
+    cpu_load_limit: float
+    disk_write_mbps: float
+    disk_reserve_mb: int
+    staging_dir: str | None
+    migrate_mbps: float
+    write_buffer_mb: int
+    capture_slots: int
+    transcode_workers: int
+    derivatives: str
+    previews: bool
+    audio_analysis: bool
 
     @property
     def auth_enabled(self) -> bool:
@@ -19,15 +43,63 @@ class AppConfig:
 def load_config() -> AppConfig:
     output_dir = os.environ.get("VHS_OUTPUT_DIR", "/output")
     log_file = os.environ.get("VHS_LOG_FILE", os.path.join(output_dir, "vhs-ui.log"))
+    journal_file = os.environ.get("VHS_JOURNAL_FILE", os.path.join(output_dir, ".vhs-journal.sqlite3"))
     host = os.environ.get("VHS_UI_HOST", "0.0.0.0")
     port = int(os.environ.get("VHS_UI_PORT", "8099"))
     auth_user = os.environ.get("VHS_UI_USER")
     auth_pass = os.environ.get("VHS_UI_PASS")
+    log_flush_seconds = float(os.environ.get("VHS_LOG_FLUSH_SECONDS", "1.0"))
+    stop_grace_seconds = float(os.environ.get("VHS_STOP_GRACE_SECONDS", "10"))
+    stall_seconds = float(os.environ.get("VHS_STALL_SECONDS", "30"))
+    stall_restart = os.environ.get("VHS_STALL_RESTART", "").lower() in {"1", "true", "yes"}
+    input_buffer_mb = int(os.environ.get("VHS_INPUT_BUFFER_MB", "512"))
+    capture_cpus = os.environ.get("VHS_CAPTURE_CPUS", "")
+    capture_nice = os.environ.get("VHS_CAPTURE_NICE", "")
+    capture_ionice = os.environ.get("VHS_CAPTURE_IONICE", "")
+    background_cpus = os.environ.get("VHS_BACKGROUND_CPUS", "")
+    background_nice = os.environ.get("VHS_BACKGROUND_NICE", "10")
+    background_ionice = os.environ.get("VHS_BACKGROUND_IONICE", "idle")
+    log_flush_bytes = int(os.environ.get("VHS_LOG_FLUSH_BYTES", str(64 * 1024)))
+    cpu_load_limit = float(os.environ.get("VHS_CPU_LOAD_LIMIT", "0.85"))
+    disk_write_mbps = float(os.environ.get("VHS_DISK_WRITE_MBPS", "0"))
+    disk_reserve_mb = int(os.environ.get("VHS_DISK_RESERVE_MB", "2048"))
+    staging_dir = os.environ.get("VHS_STAGING_DIR") or None
+    migrate_mbps = float(os.environ.get("VHS_MIGRATE_MBPS", "50"))
+    write_buffer_mb = int(os.environ.get("VHS_WRITE_BUFFER_MB", "0"))
+    capture_slots = int(os.environ.get("VHS_CAPTURE_SLOTS", "1"))
+    transcode_workers = int(os.environ.get("VHS_TRANSCODE_WORKERS", "1"))
+    derivatives = os.environ.get("VHS_DERIVATIVES", "h264_proxy")
+    previews = os.environ.get("VHS_PREVIEWS", "1").lower() in {"1", "true", "yes"}
+    audio_analysis = os.environ.get("VHS_AUDIO_ANALYSIS", "1").lower() in {"1", "true", "yes"}
     return AppConfig(
         output_dir=output_dir,
         log_file=log_file,
+        journal_file=journal_file,
         host=host,
         port=port,
         auth_user=auth_user,
         auth_pass=auth_pass,
+        log_flush_seconds=log_flush_seconds,
+        log_flush_bytes=log_flush_bytes,
+        stop_grace_seconds=stop_grace_seconds,
+        stall_seconds=stall_seconds,
+        stall_restart=stall_restart,
+        input_buffer_mb=input_buffer_mb,
+        capture_cpus=capture_cpus,
+        capture_nice=capture_nice,
+        capture_ionice=capture_ionice,
+        background_cpus=background_cpus,
+        background_nice=background_nice,
+        background_ionice=background_ionice,
+        cpu_load_limit=cpu_load_limit,
+        disk_write_mbps=disk_write_mbps,
+        disk_reserve_mb=disk_reserve_mb,
+        staging_dir=staging_dir,
+        migrate_mbps=migrate_mbps,
+        write_buffer_mb=write_buffer_mb,
+        capture_slots=capture_slots,
+        transcode_workers=transcode_workers,
+        derivatives=derivatives,
+        previews=previews,
+        audio_analysis=audio_analysis,
     )
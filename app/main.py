@@ -1,6 +1,8 @@
+import array
+import dataclasses
 import datetime as dt
 import logging
-import os
+import math
 import secrets
 from pathlib import Path
 
@@ -10,6 +12,13 @@ from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.templating import Jinja2Templates
 
 from app.config import load_config
+from scripts.analysis import AudioAnalyzer
+from scripts.deck_queue import DeckQueue
+from scripts.migrate import ArchiveMigrator
+from scripts.previews import PreviewCache
+from scripts.priority import ProcessPriority
+from scripts.scheduler import CaptureScheduler
+from scripts.transcode import JOB_PENDING, JOB_RUNNING, TranscodePool, parse_kinds
 from scripts.capture import (
     CaptureManager,
     CaptureOptions,
@@ -18,6 +27,7 @@ from scripts.capture import (
     list_audio_devices,
     list_video_devices,
     parse_duration,
+    resolve_recording,
 )
 
 config = load_config()
@@ -26,6 +36,8 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(mess
 logger = logging.getLogger("vhs-ui")
 
 Path(config.output_dir).mkdir(parents=True, exist_ok=True)
+if config.staging_dir:
+    Path(config.staging_dir).mkdir(parents=True, exist_ok=True)
 file_handler = logging.FileHandler(config.log_file)
 file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
 logging.getLogger().addHandler(file_handler)
@@ -37,7 +49,54 @@ app = FastAPI()
 security = HTTPBasic(auto_error=False)
 
 templates = Jinja2Templates(directory="app/templates")
-manager = CaptureManager(config.output_dir, config.log_file)
+
+PRESETS = [
+    ("archival_lossless", "Archival (FFV1 + FLAC)"),
+    ("archival_with_proxy", "Archival (FFV1 + FLAC) plus H.264 proxy, one pass"),
+    ("high_quality_h264", "High quality H.264 + AAC"),
+    ("passthrough_if_possible", "Passthrough if possible"),
+]
+
+manager = CaptureManager(
+    config.output_dir,
+    config.log_file,
+    log_flush_seconds=config.log_flush_seconds,
+    log_flush_bytes=config.log_flush_bytes,
+    journal_file=config.journal_file,
+    stop_grace_seconds=config.stop_grace_seconds,
+    stall_seconds=config.stall_seconds,
+    stall_restart=config.stall_restart,
+    input_buffer_budget_bytes=config.input_buffer_mb * 1024 * 1024,
+    capture_priority=ProcessPriority.from_settings(config.capture_cpus, config.capture_nice, config.capture_ionice),
+    background_priority=ProcessPriority.from_settings(
+        config.background_cpus, config.background_nice, config.background_ionice
+    ),
+    cpu_load_limit=config.cpu_load_limit,
+    disk_write_bytes_per_second=config.disk_write_mbps * 1_000_000 or None,
+    disk_reserve_bytes=config.disk_reserve_mb * 1024 * 1024,
+    staging_dir=config.staging_dir,
+    write_buffer_bytes=config.write_buffer_mb * 1024 * 1024,
+    capture_slots=config.capture_slots,
+)
+deck_queue = DeckQueue(manager)
+scheduler = CaptureScheduler(deck_queue, manager.journal)
+migrator = (
+    ArchiveMigrator(manager, config.staging_dir, config.output_dir, config.migrate_mbps * 1_000_000 or None)
+    if config.staging_dir
+    else None
+)
+transcoder = TranscodePool(
+    manager,
+    config.output_dir,
+    config.staging_dir,
+    workers=config.transcode_workers,
+    kinds=parse_kinds(config.derivatives),
+)
+previews = PreviewCache(manager, config.output_dir, config.staging_dir) if config.previews else None
+analyzer = AudioAnalyzer(manager, config.output_dir, config.staging_dir) if config.audio_analysis else None
+
+# Preview files are named by the content of the recording, so they never change.
+PREVIEW_CACHE_CONTROL = "private, max-age=31536000, immutable"
 
 
 def auth_dependency(credentials: HTTPBasicCredentials | None = Depends(security)) -> None:
@@ -52,6 +111,32 @@ def auth_dependency(credentials: HTTPBasicCredentials | None = Depends(security)
     return None
 
 
+@app.on_event("startup")
+async def startup() -> None:
+    await manager.recover()
+    scheduler.start()
+    if migrator is not None:
+        migrator.start()
+    transcoder.start()
+    if previews is not None:
+        previews.start()
+    if analyzer is not None:
+        analyzer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await scheduler.close()
+    await transcoder.close()
+    if previews is not None:
+        await previews.close()
+    if analyzer is not None:
+        await analyzer.close()
+    if migrator is not None:
+        await migrator.close()
+    await manager.close()
+
+
 @app.get("/", response_class=RedirectResponse)
 async def index() -> RedirectResponse:
     return RedirectResponse(url="/capture")
@@ -65,11 +150,7 @@ async def capture_page(request: Request) -> HTMLResponse:
             "request": request,
             "video_devices": list_video_devices(),
             "audio_devices": list_audio_devices(),
-            "presets": [
-                ("archival_lossless", "Archival (FFV1 + FLAC)"),
-                ("high_quality_h264", "High quality H.264 + AAC"),
-                ("passthrough_if_possible", "Passthrough if possible"),
-            ],
+            "presets": PRESETS,
             "output_formats": ["mkv", "mp4"],
         },
     )
@@ -88,6 +169,13 @@ async def start_capture_form(
     tape_label: str = Form(""),
     dry_run: str | None = Form(None),
     test_preview: str | None = Form(None),
+    auto_stop_seconds: str = Form(""),
+    segment_minutes: str = Form(""),
+    video_standard: str = Form("auto"),
+    audio_resync: str | None = Form(None),
+    action: str = Form("start"),
+    start_at: str = Form(""),
+    repeat_every: str = Form(""),
 ) -> HTMLResponse:
     options = build_options(
         video_device,
@@ -100,81 +188,119 @@ async def start_capture_form(
         tape_label,
         dry_run,
         test_preview,
+        auto_stop_seconds,
+        int(segment_minutes) * 60 if segment_minutes.isdigit() else None,
+        video_standard,
+        audio_resync,
     )
-    success, message, output_file = manager.start_capture(options)
-    status = manager.status()
-    return templates.TemplateResponse(
-        "status.html",
-        {
-            "request": request,
-            "message": message,
-            "output_file": output_file,
-            "status": status,
-            "elapsed": elapsed_time(status),
-            "remaining": remaining_time(status),
-        },
-    )
+    if action == "schedule":
+        schedule = add_schedule(options, start_at, repeat_every)
+        return render_status(request, f"Scheduled capture {schedule.schedule_id} for {schedule.run_at.isoformat()}.")
+    if action == "queue":
+        job = await deck_queue.enqueue(options)
+        return render_status(request, f"Queued job {job.job_id} on {options.video_device}.")
+    success, message, output_file, capture_id = await manager.start_capture(options)
+    return render_status(request, message, output_file)
 
 
 @app.get("/status", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
 async def status_page(request: Request) -> HTMLResponse:
-    status = manager.status()
-    return templates.TemplateResponse(
-        "status.html",
-        {
-            "request": request,
-            "status": status,
-            "elapsed": elapsed_time(status),
-            "remaining": remaining_time(status),
-        },
-    )
+    return render_status(request)
 
 
 @app.post("/status/stop", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
-async def stop_capture_form(request: Request) -> HTMLResponse:
-    success, message = manager.stop_capture()
-    status = manager.status()
+async def stop_capture_form(request: Request, capture_id: str = Form("")) -> HTMLResponse:
+    success, message = await manager.stop_capture(capture_id or None)
+    return render_status(request, message)
+
+
+@app.post("/status/queue/{job_id}/ready", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
+async def queue_ready_form(request: Request, job_id: str) -> HTMLResponse:
+    success, message = await deck_queue.confirm(job_id)
+    return render_status(request, message)
+
+
+@app.post("/status/queue/{job_id}/cancel", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
+async def queue_cancel_form(request: Request, job_id: str) -> HTMLResponse:
+    success, message = await deck_queue.cancel(job_id)
+    return render_status(request, message)
+
+
+@app.post("/status/schedule/{schedule_id}/cancel", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
+async def schedule_cancel_form(request: Request, schedule_id: str) -> HTMLResponse:
+    success, message = scheduler.cancel(schedule_id)
+    return render_status(request, message)
+
+
+@app.post("/status/transcode/{job_id}/cancel", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
+async def transcode_cancel_form(request: Request, job_id: str) -> HTMLResponse:
+    success, message = await transcoder.cancel(job_id)
+    return render_status(request, message)
+
+
+def render_status(request: Request, message: str | None = None, output_file: str | None = None) -> HTMLResponse:
     return templates.TemplateResponse(
         "status.html",
         {
             "request": request,
             "message": message,
-            "status": status,
-            "elapsed": elapsed_time(status),
-            "remaining": remaining_time(status),
+            "output_file": output_file,
+            "captures": capture_rows(manager.statuses()),
+            "disk": disk_payload(manager.disk_space()),
+            "queue": deck_queue.jobs(),
+            "failed_jobs": deck_queue.failed_jobs(),
+            "schedules": scheduler.schedules(),
+            "transcodes": [job for job in transcoder.jobs() if job.state in {JOB_PENDING, JOB_RUNNING}],
         },
     )
 
 
 @app.get("/recordings", response_class=HTMLResponse, dependencies=[Depends(auth_dependency)])
 async def recordings_page(request: Request) -> HTMLResponse:
-    recordings = iter_recent_recordings(config.output_dir)
+    recordings = iter_recent_recordings(config.output_dir, config.staging_dir)
+    for rec in recordings:
+        rec["preview"] = previews.lookup(rec["name"]) if previews is not None else None
+        rec["audio"] = analyzer.lookup(rec["name"]) if analyzer is not None else None
     return templates.TemplateResponse(
         "recordings.html",
-        {"request": request, "recordings": recordings, "output_dir": config.output_dir},
+        {
+            "request": request,
+            "recordings": recordings,
+            "output_dir": config.output_dir,
+            "staging_dir": config.staging_dir,
+        },
     )
 
 
 @app.get("/recordings/{filename}", dependencies=[Depends(auth_dependency)])
 async def recordings_download(filename: str):
-    safe_name = os.path.basename(filename)
-    file_path = Path(config.output_dir) / safe_name
-    if not file_path.exists() or not file_path.is_file():
+    file_path = resolve_recording(filename, config.output_dir, config.staging_dir)
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(file_path)
 
 
+@app.get("/previews/{filename}", dependencies=[Depends(auth_dependency)])
+async def preview_file(filename: str):
+    file_path = previews.path(filename) if previews is not None else None
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return FileResponse(file_path, headers={"Cache-Control": PREVIEW_CACHE_CONTROL})
+
+
 @app.get("/api/status", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
-async def api_status() -> JSONResponse:
-    status = manager.status()
+async def api_status(capture_id: str = "", video_device: str = "") -> JSONResponse:
+    ref = capture_id or video_device
+    if ref:
+        status = manager.status(ref)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Capture not found")
+        return JSONResponse(content=status_payload(status))
+    statuses = manager.statuses()
     data = {
-        "running": status.running,
-        "output_file": status.output_file,
-        "started_at": status.started_at.isoformat() if status.started_at else None,
-        "duration_seconds": status.duration_seconds,
-        "elapsed": elapsed_time(status),
-        "remaining": remaining_time(status),
-        "stderr_tail": status.stderr_tail,
+        "running": any(status.running for status in statuses),
+        "captures": [status_payload(status) for status in statuses],
+        "disk": disk_payload(manager.disk_space()),
     }
     return JSONResponse(content=data)
 
@@ -182,28 +308,116 @@ async def api_status() -> JSONResponse:
 @app.post("/api/start", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
 async def api_start(request: Request) -> JSONResponse:
     payload = await request.json()
-    options = build_options(
-        payload.get("video_device", ""),
-        payload.get("audio_device", ""),
-        payload.get("input_type", "composite"),
-        payload.get("duration", "00:30:00"),
-        payload.get("preset", "archival_lossless"),
-        payload.get("output_format", "mkv"),
-        payload.get("filename_prefix", "capture"),
-        payload.get("tape_label", ""),
-        payload.get("dry_run"),
-        payload.get("test_preview"),
+    options = options_from_payload(payload)
+    success, message, output_file, capture_id = await manager.start_capture(options)
+    return JSONResponse(
+        content={"success": success, "message": message, "output_file": output_file, "capture_id": capture_id}
     )
-    success, message, output_file = manager.start_capture(options)
-    return JSONResponse(content={"success": success, "message": message, "output_file": output_file})
 
 
 @app.post("/api/stop", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
-async def api_stop() -> JSONResponse:
-    success, message = manager.stop_capture()
+async def api_stop(request: Request) -> JSONResponse:
+    payload = await request.json() if await request.body() else {}
+    ref = payload.get("capture_id") or payload.get("video_device")
+    success, message = await manager.stop_capture(ref or None)
+    return JSONResponse(content={"success": success, "message": message})
+
+
+@app.get("/api/devices/capabilities", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_device_capabilities(video_device: str, video_standard: str = "auto", refresh: bool = False) -> JSONResponse:
+    capabilities = await manager.devices.capabilities(video_device, refresh=refresh)
+    if capabilities is None:
+        raise HTTPException(status_code=404, detail="Device could not be probed")
+    profile = await manager.devices.profile(video_device, video_standard)
+    return JSONResponse(
+        content={
+            "capabilities": dataclasses.asdict(capabilities),
+            "profile": dataclasses.asdict(profile) if profile else None,
+        }
+    )
+
+
+@app.get("/api/capacity", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_capacity() -> JSONResponse:
+    capacity = manager.capacity
+    return JSONResponse(
+        content={
+            "cpu_cores": capacity.cpu_cores,
+            "cpu_load_limit": capacity.cpu_load_limit,
+            "disk_write_bytes_per_second": capacity.disk_write_bytes_per_second,
+            "presets": {preset: dataclasses.asdict(capacity.cost(preset)) for preset, _ in PRESETS},
+            "running": [dataclasses.asdict(load) for load in manager.loads()],
+        }
+    )
+
+
+@app.get("/api/queue", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_queue(video_device: str = "") -> JSONResponse:
+    jobs = deck_queue.jobs(video_device or None)
+    failed = [job for job in deck_queue.failed_jobs() if not video_device or job.options.video_device == video_device]
+    return JSONResponse(
+        content={
+            "jobs": [queued_job_payload(job) for job in jobs],
+            "failed": [queued_job_payload(job) for job in failed],
+        }
+    )
+
+
+@app.post("/api/queue", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_enqueue(request: Request) -> JSONResponse:
+    payload = await request.json()
+    options = options_from_payload(payload)
+    job = await deck_queue.enqueue(options, ready=bool(payload.get("ready")))
+    return JSONResponse(content={"success": True, "job": queued_job_payload(job)})
+
+
+@app.post("/api/queue/{job_id}/ready", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_queue_ready(job_id: str) -> JSONResponse:
+    success, message = await deck_queue.confirm(job_id)
     return JSONResponse(content={"success": success, "message": message})
 
 
+@app.post("/api/queue/{job_id}/move", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_queue_move(job_id: str, request: Request) -> JSONResponse:
+    payload = await request.json()
+    try:
+        position = int(payload.get("position", 0))
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="Position must be an integer.") from exc
+    success, message = await deck_queue.move(job_id, position)
+    return JSONResponse(content={"success": success, "message": message})
+
+
+@app.post("/api/queue/{job_id}/cancel", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_queue_cancel(job_id: str) -> JSONResponse:
+    success, message = await deck_queue.cancel(job_id)
+    return JSONResponse(content={"success": success, "message": message})
+
+
+@app.get("/api/schedule", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_schedules() -> JSONResponse:
+    return JSONResponse(content={"schedules": [schedule_payload(schedule) for schedule in scheduler.schedules()]})
+
+
+@app.post("/api/schedule", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_schedule(request: Request) -> JSONResponse:
+    payload = await request.json()
+    options = options_from_payload(payload)
+    schedule = add_schedule(options, payload.get("start_at", ""), payload.get("repeat_every", ""))
+    return JSONResponse(content={"success": True, "schedule": schedule_payload(schedule)})
+
+
+@app.post("/api/schedule/{schedule_id}/cancel", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_schedule_cancel(schedule_id: str) -> JSONResponse:
+    success, message = scheduler.cancel(schedule_id)
+    return JSONResponse(content={"success": success, "message": message})
+
+
+@app.get("/api/history", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_history(limit: int = 50) -> JSONResponse:
+    return JSONResponse(content={"captures": manager.history(limit)})
+
+
 @app.get("/api/recordings", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
 async def api_recordings() -> JSONResponse:
     recordings = [
@@ -211,12 +425,100 @@ async def api_recordings() -> JSONResponse:
             "name": rec["name"],
             "size": rec["size"],
             "mtime": rec["mtime"].isoformat(),
+            "staged": rec["staged"],
+            "preview": preview_payload(previews.lookup(rec["name"])) if previews is not None else None,
+            "audio": analysis_payload(analyzer.lookup(rec["name"])) if analyzer is not None else None,
         }
-        for rec in iter_recent_recordings(config.output_dir)
+        for rec in iter_recent_recordings(config.output_dir, config.staging_dir)
     ]
     return JSONResponse(content={"recordings": recordings})
 
 
+@app.get("/api/recordings/{filename}/analysis", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_recording_analysis(filename: str) -> JSONResponse:
+    if resolve_recording(filename, config.output_dir, config.staging_dir) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    analysis = analyzer.lookup(filename, waveform=True) if analyzer is not None else None
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Audio analysis not available yet")
+    payload = analysis_payload(analysis)
+    levels = array.array("b", analysis.waveform)
+    payload["waveform"] = {
+        "point_seconds": analysis.point_seconds,
+        "min": levels[0::2].tolist(),
+        "max": levels[1::2].tolist(),
+    }
+    return JSONResponse(content=payload)
+
+
+@app.get("/api/migrations", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_migrations() -> JSONResponse:
+    migrations = migrator.migrations() if migrator is not None else []
+    return JSONResponse(content={"migrations": [migration_payload(migration) for migration in migrations]})
+
+
+@app.get("/api/transcode", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_transcode_jobs() -> JSONResponse:
+    return JSONResponse(content={"jobs": [transcode_payload(job) for job in transcoder.jobs()]})
+
+
+@app.post("/api/transcode", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_transcode_enqueue(request: Request) -> JSONResponse:
+    payload = await request.json()
+    source = resolve_recording(payload.get("file", ""), config.output_dir, config.staging_dir)
+    if source is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        job = await transcoder.enqueue(str(source), payload.get("kind", ""))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    return JSONResponse(content={"success": True, "job": transcode_payload(job)})
+
+
+@app.post("/api/transcode/{job_id}/cancel", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_transcode_cancel(job_id: str) -> JSONResponse:
+    success, message = await transcoder.cancel(job_id)
+    return JSONResponse(content={"success": success, "message": message})
+
+
+@app.get("/api/transcode/{job_id}/log", response_class=JSONResponse, dependencies=[Depends(auth_dependency)])
+async def api_transcode_log(job_id: str) -> JSONResponse:
+    job = transcoder.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Transcode job not found")
+    return JSONResponse(content={"job_id": job.job_id, "state": job.state, "lines": list(job.log)})
+
+
+def add_schedule(options: CaptureOptions, start_at: str, repeat_every: str):
+    if not start_at:
+        raise HTTPException(status_code=400, detail="Start time is required.")
+    try:
+        run_at = dt.datetime.fromisoformat(start_at)
+        repeat_seconds = parse_duration(repeat_every) if repeat_every else None
+        return scheduler.add(options, run_at, repeat_seconds)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+def options_from_payload(payload: dict) -> CaptureOptions:
+    return build_options(
+        payload.get("video_device", ""),
+        payload.get("audio_device", ""),
+        payload.get("input_type", "composite"),
+        payload.get("duration", "00:30:00"),
+        payload.get("preset", "archival_lossless"),
+        payload.get("output_format", "mkv"),
+        payload.get("filename_prefix", "capture"),
+        payload.get("tape_label", ""),
+        payload.get("dry_run"),
+        payload.get("test_preview"),
+        payload.get("auto_stop_seconds"),
+        payload.get("segment_seconds"),
+        payload.get("video_standard", "auto"),
+        payload.get("audio_resync"),
+    )
+
+
 def build_options(
     video_device: str,
     audio_device: str,
@@ -228,6 +530,10 @@ def build_options(
     tape_label: str,
     dry_run: str | bool | None,
     test_preview: str | bool | None,
+    auto_stop_seconds: str | int | None = None,
+    segment_seconds: str | int | None = None,
+    video_standard: str = "auto",
+    audio_resync: str | bool | None = None,
 ) -> CaptureOptions:
     if not video_device or not audio_device:
         raise HTTPException(status_code=400, detail="Video and audio devices are required.")
@@ -235,6 +541,14 @@ def build_options(
         duration_seconds = parse_duration(duration)
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
+    try:
+        auto_stop = int(auto_stop_seconds or 0)
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="Auto-stop must be a number of seconds.") from exc
+    try:
+        segment_length = int(segment_seconds or 0)
+    except (TypeError, ValueError) as exc:
+        raise HTTPException(status_code=400, detail="Segment length must be a number of seconds.") from exc
     return CaptureOptions(
         video_device=video_device,
         audio_device=audio_device,
@@ -246,7 +560,155 @@ def build_options(
         tape_label=tape_label or None,
         dry_run=bool(dry_run),
         test_preview=bool(test_preview),
+        auto_stop_seconds=auto_stop if auto_stop > 0 else None,
+        segment_seconds=segment_length if segment_length > 0 else None,
+        video_standard=video_standard or "auto",
+        audio_resync=bool(audio_resync),
+    )
+
+
+def status_payload(status) -> dict:
+    return {
+        "capture_id": status.capture_id,
+        "video_device": status.video_device,
+        "audio_device": status.audio_device,
+        "running": status.running,
+        "state": status.state,
+        "output_file": status.output_file,
+        "proxy_file": status.proxy_file,
+        "started_at": status.started_at.isoformat() if status.started_at else None,
+        "duration_seconds": status.duration_seconds,
+        "elapsed": elapsed_time(status),
+        "remaining": remaining_time(status),
+        "stderr_tail": status.stderr_tail,
+        "progress": progress_payload(status.progress),
+        "stop_reason": status.stop_reason,
+        "stopping": status.stopping,
+        "stalled": status.stalled,
+        "continued_by": status.continued_by,
+        "continues": status.continues,
+        "queue_blocking_warnings": status.queue_blocking_warnings,
+        "thread_queue_sizes": (
+            {"video": status.queue_plan.video_packets, "audio": status.queue_plan.audio_packets}
+            if status.queue_plan
+            else None
+        ),
+        "input_buffer_bytes": status.queue_plan.buffer_bytes if status.queue_plan else None,
+        "encoder_threads": dataclasses.asdict(status.encoder_threads) if status.encoder_threads else None,
+        "closed_segments": status.closed_segments,
+        "cpu_cores": status.cpu_cores,
+        "write_buffer": dataclasses.asdict(status.write_buffer) if status.write_buffer else None,
+        "av_drift_ms": status.av_drift_ms,
+        "av_drift_ppm": status.av_drift_ppm,
+        "av_drift_warning": status.av_drift_warning,
+        "audio_resync": status.audio_resync,
+    }
+
+
+def transcode_payload(job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "kind": job.kind,
+        "source": job.source,
+        "output": job.output,
+        "capture_id": job.capture_id,
+        "state": job.state,
+        "created_at": job.created_at.isoformat(),
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "progress_seconds": job.progress_seconds,
+        "chunks": job.chunks,
+        "duration_seconds": job.duration_seconds,
+        "return_code": job.return_code,
+        "error": job.error,
+    }
+
+
+def preview_payload(preview) -> dict | None:
+    if preview is None:
+        return None
+    data = dataclasses.asdict(preview)
+    data["poster"] = f"/previews/{preview.poster}"
+    data["sprite"] = f"/previews/{preview.sprite}"
+    return data
+
+
+def analysis_payload(analysis) -> dict | None:
+    if analysis is None:
+        return None
+    return {
+        "has_audio": analysis.has_audio,
+        "silent": analysis.silent,
+        "duration_seconds": analysis.duration_seconds,
+        "integrated_lufs": finite_or_none(analysis.integrated_lufs),
+        "loudness_range_lu": finite_or_none(analysis.loudness_range_lu),
+        "true_peak_dbtp": finite_or_none(analysis.true_peak_dbtp),
+        "sample_peak_dbfs": finite_or_none(analysis.sample_peak_dbfs),
+    }
+
+
+def finite_or_none(value: float) -> float | None:
+    # -inf (digital silence) and unmeasured values have no JSON form; the
+    # sidecar stores float32, so drop the digits it cannot hold.
+    return round(value, 2) if math.isfinite(value) else None
+
+
+def migration_payload(migration) -> dict:
+    data = dataclasses.asdict(migration)
+    data["finished_at"] = migration.finished_at.isoformat() if migration.finished_at else None
+    return data
+
+
+def disk_payload(disk) -> dict | None:
+    if disk is None:
+        return None
+    data = dataclasses.asdict(disk)
+    data["time_until_full"] = (
+        format_duration(int(disk.seconds_until_full)) if disk.seconds_until_full is not None else None
     )
+    return data
+
+
+def progress_payload(progress) -> dict | None:
+    if progress is None:
+        return None
+    data = dataclasses.asdict(progress)
+    data["updated_at"] = progress.updated_at.isoformat() if progress.updated_at else None
+    return data
+
+
+def queued_job_payload(job) -> dict:
+    return {
+        "job_id": job.job_id,
+        "video_device": job.options.video_device,
+        "audio_device": job.options.audio_device,
+        "tape_label": job.options.tape_label,
+        "duration_seconds": job.options.duration_seconds,
+        "preset": job.options.preset,
+        "auto_stop_seconds": job.options.auto_stop_seconds,
+        "ready": job.ready,
+        "created_at": job.created_at.isoformat(),
+        "last_error": job.last_error,
+    }
+
+
+def schedule_payload(schedule) -> dict:
+    return {
+        "schedule_id": schedule.schedule_id,
+        "video_device": schedule.options.video_device,
+        "tape_label": schedule.options.tape_label,
+        "duration_seconds": schedule.options.duration_seconds,
+        "preset": schedule.options.preset,
+        "run_at": schedule.run_at.isoformat(),
+        "repeat_seconds": schedule.repeat_seconds,
+    }
+
+
+def capture_rows(statuses) -> list[dict]:
+    return [
+        {"status": status, "elapsed": elapsed_time(status), "remaining": remaining_time(status)}
+        for status in statuses
+    ]
 
 
 def elapsed_time(status) -> str:
@@ -0,0 +1,338 @@
+import array
+import asyncio
+import dataclasses
+import logging
+import math
+import os
+import re
+import struct
+import sys
+from pathlib import Path
+
+from scripts.capture import CaptureManager, CaptureStatus, iter_stream_lines, resolve_recording
+from scripts.journal import STATE_COMPLETED, STATE_STOPPED
+from scripts.previews import cache_key
+from scripts.priority import ProcessPriority
+from scripts.transcode import probe_media
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = ".cache/analysis"
+SIDECAR_SUFFIX = ".vhsa"
+
+# The waveform is taken from a mono mixdown at this rate; enough to show the
+# envelope, and it keeps the per-sample work in Python small.
+WAVEFORM_RATE = 8000
+WAVEFORM_POINTS = 4000
+MIN_POINT_SECONDS = 0.1
+# Below this sample peak the track holds no more than hiss.
+SILENT_PEAK_DBFS = -60.0
+
+# magic, version, flags, duration, seconds per point, integrated loudness,
+# loudness range, true peak, sample peak, point count; followed by one signed
+# byte pair (min, max) per point.
+HEADER = struct.Struct("<4sBB2xffffffI")
+MAGIC = b"VHSA"
+VERSION = 1
+FLAG_AUDIO = 1
+
+SUMMARY_VALUE_PATTERN = re.compile(r"^\s*(I|LRA|Peak):\s+(\S+)")
+
+
+@dataclasses.dataclass
+class AudioAnalysis:
+    has_audio: bool
+    duration_seconds: float
+    point_seconds: float = 0.0
+    integrated_lufs: float = math.nan
+    loudness_range_lu: float = math.nan
+    true_peak_dbtp: float = math.nan
+    sample_peak_dbfs: float = math.nan
+    # Interleaved min, max per point, scaled to -128..127.
+    waveform: bytes = b""
+
+    @property
+    def points(self) -> int:
+        return len(self.waveform) // 2
+
+    @property
+    def silent(self) -> bool:
+        return not self.has_audio or not self.sample_peak_dbfs > SILENT_PEAK_DBFS
+
+
+class AudioAnalyzer:
+    def __init__(
+        self,
+        manager: CaptureManager,
+        output_dir: str,
+        staging_dir: str | None = None,
+        priority: ProcessPriority | None = None,
+    ) -> None:
+        self._manager = manager
+        self.output_dir = output_dir
+        self.staging_dir = staging_dir
+        self.cache_dir = Path(output_dir) / CACHE_DIR
+        self.priority = priority or manager.background_priority
+        self._pending: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
+        self._failed: set[str] = set()
+        self._task: asyncio.Task | None = None
+        manager.add_listener(self._on_capture_end)
+
+    def start(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def lookup(self, name: str, waveform: bool = False) -> AudioAnalysis | None:
+        # Listings only need the header; the waveform is read on request.
+        source = resolve_recording(name, self.output_dir, self.staging_dir)
+        if source is None:
+            return None
+        key = cache_key(source)
+        if key is None:
+            return None
+        try:
+            with open(self.cache_dir / f"{key}{SIDECAR_SUFFIX}", "rb") as handle:
+                return read_sidecar(handle, waveform)
+        except FileNotFoundError:
+            self.enqueue(source.name)
+        except ValueError:
+            logger.warning("Ignoring unreadable analysis of %s", name)
+            self.enqueue(source.name)
+        return None
+
+    def enqueue(self, name: str) -> None:
+        if name in self._queued:
+            return
+        self._queued.add(name)
+        self._pending.put_nowait(name)
+
+    async def _run(self) -> None:
+        while True:
+            name = await self._pending.get()
+            try:
+                await self._analyze(name)
+            except Exception:
+                logger.exception("Analysing audio of %s failed", name)
+            finally:
+                self._queued.discard(name)
+
+    async def _analyze(self, name: str) -> None:
+        source = resolve_recording(name, self.output_dir, self.staging_dir)
+        if source is None or str(source) in self._recording_now():
+            return
+        key = cache_key(source)
+        if key is None or key in self._failed:
+            return
+        sidecar = self.cache_dir / f"{key}{SIDECAR_SUFFIX}"
+        if sidecar.exists():
+            return
+        media = await probe_media(str(source))
+        if media is None:
+            self._failed.add(key)
+            return
+        if media.has_audio:
+            analysis = await self._measure(str(source), media.duration_seconds)
+            if analysis is None:
+                self._failed.add(key)
+                return
+        else:
+            # Recorded too, so "no audio track" answers as fast as a level.
+            analysis = AudioAnalysis(has_audio=False, duration_seconds=media.duration_seconds)
+        partial = sidecar.with_name(f".{sidecar.name}")
+        with open(partial, "wb") as handle:
+            write_sidecar(handle, analysis)
+        os.replace(partial, sidecar)
+        logger.info("Analysed audio of %s", name)
+
+    async def _measure(self, source: str, duration: float) -> AudioAnalysis | None:
+        # One decode of the first audio track feeds both the loudness meter
+        # and the raw mono samples the waveform is reduced from.
+        point_seconds = max(duration / WAVEFORM_POINTS, MIN_POINT_SECONDS)
+        reducer = WaveformReducer(max(int(WAVEFORM_RATE * point_seconds), 1))
+        summary = LoudnessSummary()
+        process = await asyncio.create_subprocess_exec(
+            *self.priority.wrap(build_analysis_command(source)),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        async def read_samples() -> None:
+            assert process.stdout is not None
+            while chunk := await process.stdout.read(1 << 16):
+                reducer.feed(chunk)
+
+        async def read_log() -> None:
+            assert process.stderr is not None
+            async for line in iter_stream_lines(process.stderr):
+                summary.feed(line)
+
+        try:
+            await asyncio.gather(read_samples(), read_log())
+            return_code = await process.wait()
+        finally:
+            if process.returncode is None:
+                process.kill()
+        if return_code != 0:
+            logger.warning("Audio analysis of %s: ffmpeg exited with %s", source, return_code)
+            return None
+        return AudioAnalysis(
+            has_audio=True,
+            duration_seconds=duration,
+            point_seconds=point_seconds,
+            integrated_lufs=summary.values.get("integrated", math.nan),
+            loudness_range_lu=summary.values.get("range", math.nan),
+            true_peak_dbtp=summary.values.get("true_peak", math.nan),
+            sample_peak_dbfs=summary.values.get("sample_peak", math.nan),
+            waveform=reducer.finish(),
+        )
+
+    def _recording_now(self) -> set[str]:
+        active = set()
+        for status in self._manager.statuses():
+            if status.running:
+                active.update(path for path in (status.output_file, status.proxy_file) if path)
+        return active
+
+    async def _on_capture_end(self, status: CaptureStatus) -> None:
+        if status.state in {STATE_COMPLETED, STATE_STOPPED} and status.output_file:
+            self.enqueue(Path(status.output_file).name)
+
+
+class LoudnessSummary:
+    # ebur128 logs a line per 100 ms while it runs and a summary at the end;
+    # only the summary is read.
+    def __init__(self) -> None:
+        self.values: dict[str, float] = {}
+        self._in_summary = False
+        self._section = ""
+
+    def feed(self, line: str) -> None:
+        if "Summary:" in line:
+            self._in_summary = True
+            return
+        if not self._in_summary:
+            return
+        stripped = line.strip()
+        if stripped.endswith(":"):
+            self._section = stripped[:-1].lower()
+            return
+        match = SUMMARY_VALUE_PATTERN.match(line)
+        if match is None:
+            return
+        label, value = match.groups()
+        try:
+            number = float(value)
+        except ValueError:
+            return
+        if label == "I":
+            self.values["integrated"] = number
+        elif label == "LRA":
+            self.values["range"] = number
+        elif label == "Peak":
+            self.values["true_peak" if self._section == "true peak" else "sample_peak"] = number
+
+
+class WaveformReducer:
+    def __init__(self, samples_per_point: int) -> None:
+        self.samples_per_point = samples_per_point
+        self._pending = bytearray()
+        self._points = bytearray()
+
+    def feed(self, chunk: bytes) -> None:
+        self._pending += chunk
+        size = self.samples_per_point * 2
+        whole = len(self._pending) // size * size
+        if whole:
+            self._reduce(bytes(self._pending[:whole]))
+            del self._pending[:whole]
+
+    def finish(self) -> bytes:
+        whole = len(self._pending) // 2 * 2
+        if whole:
+            self._reduce(bytes(self._pending[:whole]))
+        self._pending.clear()
+        return bytes(self._points)
+
+    def _reduce(self, data: bytes) -> None:
+        samples = array.array("h", data)
+        if sys.byteorder != "little":
+            samples.byteswap()
+        for start in range(0, len(samples), self.samples_per_point):
+            block = samples[start : start + self.samples_per_point]
+            self._points += struct.pack("bb", min(block) >> 8, max(block) >> 8)
+
+
+def build_analysis_command(source: str) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "info",
+        "-nostats",
+        "-i",
+        source,
+        "-filter_complex",
+        f"[0:a:0]asplit=2[meter][wave];[meter]ebur128=peak=true+sample[loud];"
+        f"[wave]aformat=sample_fmts=s16:channel_layouts=mono,aresample={WAVEFORM_RATE}[samples]",
+        "-map",
+        "[loud]",
+        "-f",
+        "null",
+        "-",
+        "-map",
+        "[samples]",
+        "-f",
+        "s16le",
+        "pipe:1",
+    ]
+
+
+def write_sidecar(handle, analysis: AudioAnalysis) -> None:
+    handle.write(
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            FLAG_AUDIO if analysis.has_audio else 0,
+            analysis.duration_seconds,
+            analysis.point_seconds,
+            analysis.integrated_lufs,
+            analysis.loudness_range_lu,
+            analysis.true_peak_dbtp,
+            analysis.sample_peak_dbfs,
+            analysis.points,
+        )
+    )
+    handle.write(analysis.waveform)
+
+
+def read_sidecar(handle, waveform: bool = True) -> AudioAnalysis:
+    header = handle.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError("Truncated analysis sidecar")
+    magic, version, flags, duration, point_seconds, integrated, loudness_range, true_peak, sample_peak, points = (
+        HEADER.unpack(header)
+    )
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an analysis sidecar")
+    return AudioAnalysis(
+        has_audio=bool(flags & FLAG_AUDIO),
+        duration_seconds=duration,
+        point_seconds=point_seconds,
+        integrated_lufs=integrated,
+        loudness_range_lu=loudness_range,
+        true_peak_dbtp=true_peak,
+        sample_peak_dbfs=sample_peak,
+        waveform=handle.read(points * 2) if waveform else b"",
+    )
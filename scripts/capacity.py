@@ -0,0 +1,161 @@
+import dataclasses
+import os
+import shutil
+import statistics
+
+from scripts.journal import CaptureJournal
+
+# Starting estimates for one SD deck, used until the journal holds measured
+# captures of a preset.
+DEFAULT_CPU_CORES = {
+    "archival_lossless": 1.5,
+    "archival_with_proxy": 2.5,
+    "high_quality_h264": 1.5,
+    "passthrough_if_possible": 0.2,
+}
+DEFAULT_BYTES_PER_SECOND = {
+    "archival_lossless": 9_000_000,
+    "archival_with_proxy": 9_500_000,
+    "high_quality_h264": 1_500_000,
+    "passthrough_if_possible": 4_000_000,
+}
+
+HISTORY_SAMPLES = 10
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+@dataclasses.dataclass
+class PresetCost:
+    cpu_cores: float
+    bytes_per_second: float
+    samples: int = 0
+
+
+@dataclasses.dataclass
+class CaptureLoad:
+    capture_id: str
+    preset: str
+    cpu_cores: float | None = None
+    bytes_per_second: float | None = None
+    remaining_seconds: float | None = None
+    segmented: bool = False
+
+
+@dataclasses.dataclass
+class DiskSpace:
+    free_bytes: int
+    reserve_bytes: int
+    write_bytes_per_second: float
+    seconds_until_full: float | None
+
+
+class CapacityPlanner:
+    def __init__(
+        self,
+        journal: CaptureJournal | None,
+        cpu_cores: float,
+        cpu_load_limit: float = 0.85,
+        disk_write_bytes_per_second: float | None = None,
+    ) -> None:
+        self._journal = journal
+        self.cpu_cores = cpu_cores
+        self.cpu_load_limit = cpu_load_limit
+        self.disk_write_bytes_per_second = disk_write_bytes_per_second
+
+    def cost(self, preset: str) -> PresetCost:
+        # Median of the most recent measured captures, so one odd tape does
+        # not skew the estimate.
+        entries = self._journal.measured(preset, HISTORY_SAMPLES) if self._journal is not None else []
+        cpu = [entry["metadata"]["cpu_cores"] for entry in entries if entry["metadata"].get("cpu_cores")]
+        rate = [entry["metadata"]["bytes_per_second"] for entry in entries if entry["metadata"].get("bytes_per_second")]
+        return PresetCost(
+            cpu_cores=statistics.median(cpu) if cpu else DEFAULT_CPU_CORES.get(preset, 1.5),
+            bytes_per_second=statistics.median(rate) if rate else DEFAULT_BYTES_PER_SECOND.get(preset, 9_000_000),
+            samples=len(entries),
+        )
+
+    def refusal(self, preset: str, running: list[CaptureLoad]) -> str | None:
+        new = self.cost(preset)
+        cpu_used = 0.0
+        write_used = 0.0
+        for load in running:
+            # Live measurements where the capture has them, the estimate otherwise.
+            estimate = self.cost(load.preset) if load.cpu_cores is None or load.bytes_per_second is None else None
+            cpu_used += load.cpu_cores if load.cpu_cores is not None else estimate.cpu_cores
+            write_used += load.bytes_per_second if load.bytes_per_second is not None else estimate.bytes_per_second
+        cpu_limit = self.cpu_cores * self.cpu_load_limit
+        if running and cpu_used + new.cpu_cores > cpu_limit:
+            return (
+                f"Not enough CPU for another {preset} capture: it needs about {new.cpu_cores:.1f} cores, "
+                f"{cpu_used:.1f} of {cpu_limit:.1f} are in use by {len(running)} running capture(s)."
+            )
+        if self.disk_write_bytes_per_second and running:
+            if write_used + new.bytes_per_second > self.disk_write_bytes_per_second:
+                return (
+                    f"Not enough disk bandwidth for another {preset} capture: it writes about "
+                    f"{new.bytes_per_second / 1e6:.1f} MB/s, {write_used / 1e6:.1f} of "
+                    f"{self.disk_write_bytes_per_second / 1e6:.1f} MB/s are in use."
+                )
+        return None
+
+    def write_rate(self, load: CaptureLoad) -> float:
+        if load.bytes_per_second is not None:
+            return load.bytes_per_second
+        return self.cost(load.preset).bytes_per_second
+
+    def bytes_needed(self, preset: str, duration_seconds: float, segmented: bool = False) -> float:
+        # Joining segments writes the whole capture a second time before the
+        # parts are removed.
+        return self.cost(preset).bytes_per_second * duration_seconds * (2 if segmented else 1)
+
+    def space_refusal(
+        self,
+        preset: str,
+        duration_seconds: float,
+        segmented: bool,
+        path: str,
+        reserve_bytes: int,
+        running: list[CaptureLoad],
+    ) -> str | None:
+        try:
+            free = shutil.disk_usage(path).free
+        except OSError:
+            return None
+        committed = sum(
+            self.write_rate(load) * load.remaining_seconds * (2 if load.segmented else 1)
+            for load in running
+            if load.remaining_seconds
+        )
+        needed = self.bytes_needed(preset, duration_seconds, segmented)
+        available = free - reserve_bytes - committed
+        if needed <= available:
+            return None
+        return (
+            f"Not enough disk space: this capture needs about {needed / 1e9:.1f} GB, "
+            f"{max(available, 0) / 1e9:.1f} GB are free after the {reserve_bytes / 1e9:.1f} GB reserve"
+            + (f" and {committed / 1e9:.1f} GB still to be written by running captures." if committed else ".")
+        )
+
+    def disk_space(self, path: str, reserve_bytes: int, running: list[CaptureLoad]) -> DiskSpace | None:
+        try:
+            free = shutil.disk_usage(path).free
+        except OSError:
+            return None
+        rate = sum(self.write_rate(load) for load in running)
+        return DiskSpace(
+            free_bytes=free,
+            reserve_bytes=reserve_bytes,
+            write_bytes_per_second=rate,
+            seconds_until_full=max(free - reserve_bytes, 0) / rate if rate else None,
+        )
+
+
+def process_cpu_seconds(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as handle:
+            stat = handle.read()
+    except OSError:
+        return None
+    # The command name may contain spaces; fields after it are fixed.
+    fields = stat[stat.rfind(")") + 2 :].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
@@ -1,19 +1,68 @@
+import asyncio
 import dataclasses
 import datetime as dt
 import logging
 import os
 import re
 import shlex
+import shutil
 import signal
 import subprocess
-import threading
+import time
+import uuid
 from collections import deque
 from pathlib import Path
-from typing import Iterable
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+
+from scripts.capacity import CapacityPlanner, CaptureLoad, DiskSpace, process_cpu_seconds
+from scripts.checksum import SIDECAR_SUFFIX, write_checksum_sidecar
+from scripts.devices import DeviceCatalog, InputProfile
+from scripts.journal import (
+    STATE_COMPLETED,
+    STATE_FAILED,
+    STATE_INTERRUPTED,
+    STATE_RUNNING,
+    STATE_STALLED,
+    STATE_STOPPED,
+    CaptureJournal,
+)
+from scripts.logwriter import BufferedLogWriter
+from scripts.priority import ProcessPriority
+from scripts.tuning import (
+    QUEUE_BLOCKING_PATTERN,
+    EncoderThreads,
+    QueuePlan,
+    available_cores,
+    next_pressure_level,
+    plan_encoder_threads,
+    plan_queues,
+)
+from scripts.writebuffer import PipeWriteBuffer, WriteBufferStatus
 
 logger = logging.getLogger(__name__)
 
 FILENAME_SAFE = re.compile(r"[^a-zA-Z0-9_-]+")
+DUAL_OUTPUT_PRESETS = {"archival_with_proxy"}
+SEGMENT_OPEN_PATTERN = re.compile(r"Opening '(.+)' for writing")
+SEGMENT_LIST_NAME = "segments.ffconcat"
+END_OF_TAPE_PATTERN = re.compile(r"(?:lavfi\.)?(black|silence)_(start|end)[=:]")
+AUDIO_FRAME_PATTERN = re.compile(
+    r"Parsed_ashowinfo_\d+ .*?\bpts_time:\s*(-?[\d.]+).*?\brate:\s*(\d+).*?\bnb_samples:\s*(\d+)"
+)
+# Roughly where lip sync starts to be noticeable.
+AV_DRIFT_WARN_MS = 40.0
+# Stretches or squeezes the audio by up to 1000 samples a second so it
+# follows its timestamps instead of the sound card's sample clock.
+RESYNC_FILTER = "aresample=async=1000"
+
+STOP_OPERATOR = "operator"
+STOP_END_OF_TAPE = "end_of_tape"
+STOP_STALLED = "stalled"
+STOP_LOW_SPACE = "low_disk_space"
+STOP_SHUTDOWN = "shutdown"
+
+# CPU use is averaged from launch; the first seconds are mostly startup.
+CPU_SAMPLE_MIN_SECONDS = 5.0
 
 
 @dataclasses.dataclass
@@ -28,106 +77,1066 @@ class CaptureOptions:
     tape_label: str | None
     dry_run: bool
     test_preview: bool
+    auto_stop_seconds: int | None = None
+    segment_seconds: int | None = None
+    video_standard: str = "auto"
+    audio_resync: bool = False
+
+
+@dataclasses.dataclass
+class CaptureProgress:
+    frame: int = 0
+    fps: float = 0.0
+    bitrate_kbps: float | None = None
+    total_size: int | None = None
+    out_time_seconds: float = 0.0
+    dup_frames: int = 0
+    drop_frames: int = 0
+    speed: float | None = None
+    updated_at: dt.datetime | None = None
+
+
+class ProgressParser:
+    def __init__(self) -> None:
+        self._fields: dict[str, str] = {}
+
+    def feed(self, line: str) -> CaptureProgress | None:
+        key, sep, value = line.partition("=")
+        if not sep:
+            return None
+        key = key.strip()
+        value = value.strip()
+        if key != "progress":
+            self._fields[key] = value
+            return None
+        fields, self._fields = self._fields, {}
+        out_time_us = _parse_number(fields.get("out_time_us"), int)
+        return CaptureProgress(
+            frame=_parse_number(fields.get("frame"), int) or 0,
+            fps=_parse_number(fields.get("fps"), float) or 0.0,
+            bitrate_kbps=_parse_number(fields.get("bitrate", "").removesuffix("kbits/s"), float),
+            total_size=_parse_number(fields.get("total_size"), int),
+            out_time_seconds=out_time_us / 1_000_000 if out_time_us else 0.0,
+            dup_frames=_parse_number(fields.get("dup_frames"), int) or 0,
+            drop_frames=_parse_number(fields.get("drop_frames"), int) or 0,
+            speed=_parse_number(fields.get("speed", "").removesuffix("x"), float),
+            updated_at=dt.datetime.now(),
+        )
+
+
+def _parse_number(value: str | None, kind: type):
+    if value is None:
+        return None
+    try:
+        return kind(value.strip())
+    except ValueError:
+        return None
+
+
+class EndOfTapeDetector:
+    # Tracks blackdetect/silencedetect transitions printed on ffmpeg's stderr.
+    # The tape is considered finished once picture and sound have both been
+    # blank for hold_seconds of wall-clock time.
+    def __init__(self, hold_seconds: int) -> None:
+        self.hold_seconds = hold_seconds
+        self.black_since: float | None = None
+        self.silent_since: float | None = None
+
+    def feed(self, line: str, now: float) -> None:
+        match = END_OF_TAPE_PATTERN.search(line)
+        if match is None:
+            return
+        kind, edge = match.group(1), match.group(2)
+        since = now if edge == "start" else None
+        if kind == "black":
+            self.black_since = since
+        else:
+            self.silent_since = since
+
+    def triggered(self, now: float) -> bool:
+        if self.black_since is None or self.silent_since is None:
+            return False
+        return now - max(self.black_since, self.silent_since) >= self.hold_seconds
+
+
+class DriftMeter:
+    # Compares the audio input's timestamps, which follow the system clock
+    # like the video's, with the time implied by the number of samples the
+    # sound card delivered. Encoders lay audio out by sample count, so any
+    # difference ends up as A/V offset in the file. Positive drift means the
+    # card runs slow and the audio leads the picture.
+    def __init__(self) -> None:
+        self.first_pts: float | None = None
+        self.samples = 0
+        self.drift_seconds = 0.0
+        self.media_seconds = 0.0
+
+    def feed(self, line: str) -> bool:
+        match = AUDIO_FRAME_PATTERN.search(line)
+        if match is None:
+            return False
+        pts_time, rate, nb_samples = float(match.group(1)), int(match.group(2)), int(match.group(3))
+        if self.first_pts is None:
+            self.first_pts = pts_time
+        else:
+            self.media_seconds = pts_time - self.first_pts
+            self.drift_seconds = self.media_seconds - self.samples / rate
+        self.samples += nb_samples
+        return True
+
+    @property
+    def drift_ms(self) -> float | None:
+        return self.drift_seconds * 1000 if self.first_pts is not None else None
+
+    @property
+    def drift_ppm(self) -> float | None:
+        if self.media_seconds <= 0:
+            return None
+        return self.drift_seconds / self.media_seconds * 1_000_000
 
 
 @dataclasses.dataclass
 class CaptureStatus:
+    capture_id: str
+    video_device: str
+    audio_device: str
     running: bool
     output_file: str | None
     started_at: dt.datetime | None
     duration_seconds: int | None
     stderr_tail: list[str]
+    proxy_file: str | None = None
+    progress: CaptureProgress | None = None
+    stop_reason: str | None = None
+    stopping: bool = False
+    stalled: bool = False
+    continued_by: str | None = None
+    continues: str | None = None
+    queue_plan: QueuePlan | None = None
+    queue_blocking_warnings: int = 0
+    encoder_threads: EncoderThreads | None = None
+    closed_segments: int = 0
+    cpu_cores: float | None = None
+    write_buffer: WriteBufferStatus | None = None
+    av_drift_ms: float | None = None
+    av_drift_ppm: float | None = None
+    av_drift_warning: bool = False
+    audio_resync: bool = False
+    preset: str | None = None
+    state: str | None = None
+
+
+class _AttachedProcess:
+    # Stands in for asyncio.subprocess.Process when an ffmpeg that outlived a
+    # restart is reattached from the journal. It is no longer our child, so
+    # the exit status is unknown and liveness is polled through /proc.
+    stdout = None
+    stderr = None
+
+    def __init__(self, pid: int, output_file: str) -> None:
+        self.pid = pid
+        self.output_file = output_file
+        # Stays None: only the parent that was restarted could have reaped it.
+        self.returncode: int | None = None
+        self.exited = False
+
+    def alive(self) -> bool:
+        if not self.exited and not pid_matches(self.pid, self.output_file):
+            self.exited = True
+        return not self.exited
+
+    async def wait(self) -> int | None:
+        while self.alive():
+            await asyncio.sleep(1)
+        return self.returncode
+
+    def send_signal(self, sig: int) -> None:
+        try:
+            os.kill(self.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+class _Capture:
+    def __init__(
+        self,
+        capture_id: str,
+        options: CaptureOptions,
+        process: asyncio.subprocess.Process | _AttachedProcess,
+        output_file: str,
+        duration_seconds: int,
+        started_at: dt.datetime | None = None,
+        proxy_file: str | None = None,
+        queue_plan: QueuePlan | None = None,
+        encoder_threads: EncoderThreads | None = None,
+    ) -> None:
+        self.capture_id = capture_id
+        self.options = options
+        self.process = process
+        self.output_file = output_file
+        self.proxy_file = proxy_file
+        self.queue_plan = queue_plan
+        self.queue_blocking_warnings = 0
+        self.encoder_threads = encoder_threads
+        self.duration_seconds = duration_seconds
+        self.started_at = started_at or dt.datetime.now()
+        self.stderr_tail: deque[str] = deque(maxlen=50)
+        self.progress: CaptureProgress | None = None
+        self.supervisor: asyncio.Task | None = None
+        self.stop_reason: str | None = None
+        self.stop_task: asyncio.Task | None = None
+        self.last_frame_at = time.monotonic()
+        self.launched_at = self.last_frame_at
+        self.cpu_cores: float | None = None
+        self.write_buffer: PipeWriteBuffer | None = None
+        self.stalled_since: dt.datetime | None = None
+        self.continued_by: str | None = None
+        # The stalled capture this one took over from; kept so the finished
+        # original stays visible while its continuation runs on the deck.
+        self.continues: _Capture | None = None
+        self.end_of_tape = EndOfTapeDetector(options.auto_stop_seconds) if options.auto_stop_seconds else None
+        self.drift = DriftMeter() if measures_drift(options) else None
+        self.segment_dir = segment_dir(output_file) if options.segment_seconds else None
+        self.open_segment: str | None = None
+        self.closed_segments: list[str] = []
+        self.segment_tasks: set[asyncio.Task] = set()
+
+    def is_running(self) -> bool:
+        if isinstance(self.process, _AttachedProcess):
+            return self.process.alive()
+        return self.process.returncode is None
+
+    def final_state(self) -> str:
+        if self.stop_reason in {STOP_OPERATOR, STOP_LOW_SPACE, STOP_SHUTDOWN}:
+            return STATE_STOPPED
+        if self.stop_reason == STOP_STALLED:
+            return STATE_STALLED
+        if isinstance(self.process, _AttachedProcess) and self.stop_reason is None:
+            # It ended on its own while we could not see how; the file may
+            # lack its trailer, so it is not reported as a good capture.
+            return STATE_INTERRUPTED
+        if self.stop_reason is not None or self.process.returncode == 0:
+            return STATE_COMPLETED
+        return STATE_FAILED
+
+    def status(self) -> CaptureStatus:
+        running = self.is_running()
+        return CaptureStatus(
+            capture_id=self.capture_id,
+            video_device=self.options.video_device,
+            audio_device=self.options.audio_device,
+            running=running,
+            output_file=self.output_file,
+            started_at=self.started_at,
+            duration_seconds=self.duration_seconds,
+            stderr_tail=list(self.stderr_tail),
+            proxy_file=self.proxy_file,
+            progress=self.progress,
+            stop_reason=self.stop_reason,
+            stopping=self.stop_reason is not None and running,
+            stalled=self.stalled_since is not None,
+            continued_by=self.continued_by,
+            continues=self.continues.capture_id if self.continues is not None else None,
+            queue_plan=self.queue_plan,
+            queue_blocking_warnings=self.queue_blocking_warnings,
+            encoder_threads=self.encoder_threads,
+            closed_segments=len(self.closed_segments),
+            cpu_cores=self.cpu_cores,
+            write_buffer=self.write_buffer.snapshot() if self.write_buffer is not None else None,
+            av_drift_ms=self.drift.drift_ms if self.drift is not None else None,
+            av_drift_ppm=self.drift.drift_ppm if self.drift is not None else None,
+            av_drift_warning=self.drift_warning(),
+            audio_resync=self.options.audio_resync,
+            preset=self.options.preset,
+            state=STATE_RUNNING if running else self.final_state(),
+        )
+
+    def drift_warning(self) -> bool:
+        # With resync on, the measured drift is being corrected in the output.
+        if self.drift is None or self.drift.drift_ms is None or self.options.audio_resync:
+            return False
+        return abs(self.drift.drift_ms) > AV_DRIFT_WARN_MS
+
+    def load(self) -> CaptureLoad:
+        bytes_per_second = None
+        if self.progress is not None and self.progress.out_time_seconds and self.progress.total_size:
+            bytes_per_second = self.progress.total_size / self.progress.out_time_seconds
+        remaining = None
+        if self.duration_seconds:
+            elapsed = self.progress.out_time_seconds if self.progress is not None else 0.0
+            remaining = max(self.duration_seconds - elapsed, 0.0)
+        return CaptureLoad(
+            self.capture_id,
+            self.options.preset,
+            self.cpu_cores,
+            bytes_per_second,
+            remaining,
+            self.segment_dir is not None,
+        )
 
 
 class CaptureManager:
-    def __init__(self, output_dir: str, log_file: str) -> None:
+    def __init__(
+        self,
+        output_dir: str,
+        log_file: str,
+        log_flush_seconds: float = 1.0,
+        log_flush_bytes: int = 64 * 1024,
+        journal_file: str | None = None,
+        stop_grace_seconds: float = 10.0,
+        stall_seconds: float = 30.0,
+        stall_restart: bool = False,
+        input_buffer_budget_bytes: int = 512 * 1024 * 1024,
+        capture_priority: ProcessPriority | None = None,
+        background_priority: ProcessPriority | None = None,
+        cpu_load_limit: float = 0.85,
+        disk_write_bytes_per_second: float | None = None,
+        disk_reserve_bytes: int = 2 * 1024 * 1024 * 1024,
+        staging_dir: str | None = None,
+        write_buffer_bytes: int = 0,
+        capture_slots: int = 1,
+    ) -> None:
         self.output_dir = output_dir
+        self.staging_dir = staging_dir
+        self.write_buffer_bytes = write_buffer_bytes
+        self.capture_slots = max(capture_slots, 1)
         self.log_file = log_file
-        self._lock = threading.Lock()
-        self._process: subprocess.Popen[str] | None = None
-        self._stderr_tail: deque[str] = deque(maxlen=50)
-        self._started_at: dt.datetime | None = None
-        self._duration_seconds: int | None = None
-        self._output_file: str | None = None
-        self._stderr_thread: threading.Thread | None = None
+        self.stop_grace_seconds = stop_grace_seconds
+        self.stall_seconds = stall_seconds
+        self.stall_restart = stall_restart
+        self._watchdog: asyncio.Task | None = None
+        self.devices = DeviceCatalog()
+        self.input_buffer_budget_bytes = input_buffer_budget_bytes
+        self.disk_reserve_bytes = disk_reserve_bytes
+        self._queue_pressure: dict[str, int] = {}
+        # Live captures vs. offline work such as joining segments.
+        self.capture_priority = capture_priority or ProcessPriority()
+        self.background_priority = background_priority or ProcessPriority(nice=10, ionice_class="idle")
+        self._log = BufferedLogWriter(log_file, flush_interval=log_flush_seconds, flush_bytes=log_flush_bytes)
+        self._journal = CaptureJournal(journal_file) if journal_file else None
+        self.capacity = CapacityPlanner(
+            self._journal,
+            available_cores(self.capture_priority.cpus),
+            cpu_load_limit,
+            disk_write_bytes_per_second,
+        )
+        self._listeners: list[Callable[[CaptureStatus], Awaitable[None]]] = []
+        self._lock = asyncio.Lock()
+        # Keyed by video device: one capture (running or most recent) per deck.
+        self._captures: dict[str, _Capture] = {}
 
-    def is_running(self) -> bool:
-        return self._process is not None and self._process.poll() is None
+    @property
+    def journal(self) -> CaptureJournal | None:
+        return self._journal
+
+    def add_listener(self, callback: Callable[[CaptureStatus], Awaitable[None]]) -> None:
+        # Called with the final status once a capture's ffmpeg has exited.
+        self._listeners.append(callback)
+
+    def is_running(self, ref: str | None = None) -> bool:
+        if ref is None:
+            return any(capture.is_running() for capture in self._captures.values())
+        capture = self._find(ref)
+        return capture is not None and capture.is_running()
 
-    def start_capture(self, options: CaptureOptions) -> tuple[bool, str, str | None]:
-        with self._lock:
-            if self.is_running():
-                return False, "Capture already running.", None
+    def _find(self, ref: str) -> _Capture | None:
+        capture = self._captures.get(ref)
+        if capture is not None:
+            return capture
+        for capture in self._with_predecessors():
+            if capture.capture_id == ref:
+                return capture
+        return None
+
+    def _with_predecessors(self) -> list[_Capture]:
+        # Each deck's current capture, preceded by the stalled captures it
+        # continues, oldest first.
+        captures = []
+        for capture in self._captures.values():
+            chain = []
+            while capture is not None:
+                chain.append(capture)
+                capture = capture.continues
+            captures.extend(reversed(chain))
+        return captures
+
+    def _running(self) -> list[_Capture]:
+        return [capture for capture in self._captures.values() if capture.is_running()]
+
+    @property
+    def capture_dir(self) -> str:
+        return self.staging_dir or self.output_dir
+
+    def loads(self) -> list[CaptureLoad]:
+        return [capture.load() for capture in self._running()]
+
+    def disk_space(self) -> DiskSpace | None:
+        running = [capture.load() for capture in self._running() if capture.stop_reason is None]
+        return self.capacity.disk_space(self.capture_dir, self.disk_reserve_bytes, running)
+
+    async def start_capture(self, options: CaptureOptions) -> tuple[bool, str, str | None, str | None]:
+        async with self._lock:
+            if self.is_running(options.video_device):
+                return False, f"Capture already running on {options.video_device}.", None, None
+            for capture in self._running():
+                if capture.options.audio_device == options.audio_device:
+                    return False, f"Audio device {options.audio_device} is in use by capture {capture.capture_id}.", None, None
+            problem = invalid_options(options)
+            if problem is not None:
+                return False, problem, None, None
+            if not options.dry_run:
+                refusal = self.capacity.refusal(options.preset, self.loads())
+                if refusal is not None:
+                    return False, refusal, None, None
             duration = options.duration_seconds
             if options.test_preview:
                 duration = 10
+            if not options.dry_run and duration:
+                refusal = self.capacity.space_refusal(
+                    options.preset,
+                    duration,
+                    bool(options.segment_seconds),
+                    self.capture_dir,
+                    self.disk_reserve_bytes,
+                    self.loads(),
+                )
+                if refusal is not None:
+                    return False, refusal, None, None
             output_file = build_output_path(
                 self.output_dir,
                 options.filename_prefix,
                 options.tape_label,
                 options.output_format,
+                self.staging_dir,
+                {capture.output_file for capture in self._captures.values()},
+            )
+            proxy_file = build_proxy_path(output_file) if options.preset in DUAL_OUTPUT_PRESETS else None
+            profile = await self.devices.profile(options.video_device, options.video_standard)
+            queue_plan = plan_queues(
+                profile,
+                options.preset,
+                self._pressure_level(options.video_device),
+                self.input_buffer_budget_bytes,
+            )
+            encoder_threads = plan_encoder_threads(
+                options.preset,
+                available_cores(self.capture_priority.cpus),
+                len(self._running()),
+                self.capture_slots,
+            )
+            cmd = build_ffmpeg_command(
+                options,
+                duration,
+                output_file,
+                proxy_file,
+                profile,
+                queue_plan,
+                encoder_threads,
             )
-            cmd = build_ffmpeg_command(options, duration, output_file)
             if options.dry_run:
-                return True, f"Dry run command: {' '.join(shlex.quote(part) for part in cmd)}", output_file
-            ensure_directory(self.output_dir)
-            set_input_type(options.video_device, options.input_type)
-            log_handle = open(self.log_file, "a", encoding="utf-8")
-            log_handle.write(f"\n== Capture start {dt.datetime.now().isoformat()} ==\n")
-            log_handle.flush()
-            process = subprocess.Popen(
-                cmd,
-                stdout=log_handle,
-                stderr=subprocess.PIPE,
-                text=True,
+                return True, f"Dry run command: {' '.join(shlex.quote(part) for part in cmd)}", output_file, None
+            ensure_directory(self.capture_dir)
+            if options.segment_seconds:
+                ensure_directory(str(segment_dir(output_file)))
+            await set_input_type(options.video_device, options.input_type)
+            capture_id = uuid.uuid4().hex[:12]
+            self._log.write(
+                f"\n== Capture {capture_id} start {dt.datetime.now().isoformat()} ({options.video_device}) ==\n"
+            )
+            buffered = self._buffers_output(options)
+            read_fd, write_fd = os.pipe() if buffered else (None, None)
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *self.capture_priority.wrap(pipe_output(cmd, output_file, write_fd) if buffered else cmd),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    # Own session so a restart of the UI does not take ffmpeg down with it.
+                    start_new_session=True,
+                    pass_fds=(write_fd,) if write_fd is not None else (),
+                )
+            except BaseException:
+                if read_fd is not None:
+                    os.close(read_fd)
+                raise
+            finally:
+                # Only ffmpeg may hold the write end, so the buffer sees EOF when it exits.
+                if write_fd is not None:
+                    os.close(write_fd)
+            capture = _Capture(
+                capture_id,
+                options,
+                process,
+                output_file,
+                duration,
+                proxy_file=proxy_file,
+                queue_plan=queue_plan,
+                encoder_threads=encoder_threads,
+            )
+            if read_fd is not None:
+                capture.write_buffer = PipeWriteBuffer(read_fd, output_file, self.write_buffer_bytes)
+                capture.write_buffer.start()
+            self._captures[options.video_device] = capture
+            if self._journal is not None:
+                self._journal.record_start(
+                    capture_id,
+                    options.video_device,
+                    dataclasses.asdict(options),
+                    process.pid,
+                    output_file,
+                    duration,
+                    capture.started_at,
+                )
+                metadata: dict = {
+                    "input_profile": dataclasses.asdict(profile) if profile else None,
+                    "queue_plan": dataclasses.asdict(queue_plan),
+                    "priority": self.capture_priority.describe(),
+                    "encoder_threads": dataclasses.asdict(encoder_threads) if encoder_threads else None,
+                }
+                if proxy_file:
+                    metadata["proxy_file"] = proxy_file
+                if capture.write_buffer is not None:
+                    metadata["write_buffer_bytes"] = capture.write_buffer.capacity_bytes
+                self._journal.update_metadata(capture_id, metadata)
+            capture.supervisor = asyncio.create_task(self._supervise(capture))
+            self._ensure_watchdog()
+            return True, "Capture started.", output_file, capture_id
+
+    async def _supervise(self, capture: _Capture) -> None:
+        process = capture.process
+        detached = False
+        try:
+            await asyncio.gather(
+                self._read_stderr(capture),
+                self._read_progress(capture),
             )
-            self._process = process
-            self._stderr_tail.clear()
-            self._started_at = dt.datetime.now()
-            self._duration_seconds = duration
-            self._output_file = output_file
-            self._stderr_thread = threading.Thread(
-                target=self._capture_stderr,
-                args=(process, log_handle),
-                daemon=True,
+            await process.wait()
+            if capture.write_buffer is not None:
+                await self._drain_write_buffer(capture)
+                await self._index_output(capture)
+            if capture.segment_dir is not None:
+                await self._finish_segments(capture)
+            if capture.stop_reason == STOP_STALLED and self.stall_restart:
+                await self._continue_capture(capture)
+            elif capture.stalled_since is not None:
+                self._record_stall_end(capture, resumed=False)
+            self._record_queue_pressure(capture)
+            self._record_throughput(capture)
+            self._record_drift(capture)
+        except asyncio.CancelledError:
+            # Shutdown while ffmpeg keeps running in its own session: leave the
+            # journal entry open so the next start can reattach to it.
+            detached = capture.is_running()
+            raise
+        finally:
+            if self._journal is not None and not detached:
+                self._journal.record_end(capture.capture_id, capture.final_state(), process.returncode)
+            self._log.write(
+                f"\n== Capture {capture.capture_id} end {dt.datetime.now().isoformat()} (exit {process.returncode}) ==\n"
+                if not detached
+                else f"[{capture.capture_id}] Supervisor stopped; ffmpeg left running.\n"
             )
-            self._stderr_thread.start()
-            return True, "Capture started.", output_file
+            if detached:
+                self._log.flush_sync()
+            else:
+                await self._log.flush()
+        await self._notify(capture.status())
 
-    def _capture_stderr(self, process: subprocess.Popen[str], log_handle) -> None:
-        if process.stderr is None:
+    def _buffers_output(self, options: CaptureOptions) -> bool:
+        # Matroska can be muxed to a pipe (without a seek index); MP4 needs to
+        # seek back to write its header, and segments are separate files.
+        return bool(self.write_buffer_bytes) and options.output_format == "mkv" and not options.segment_seconds
+
+    async def _drain_write_buffer(self, capture: _Capture) -> None:
+        assert capture.write_buffer is not None
+        await capture.write_buffer.wait()
+        buffer = capture.write_buffer.snapshot()
+        if buffer.error is not None:
+            message = f"Writing {capture.output_file} failed: {buffer.error}"
+            capture.stderr_tail.append(message)
+            self._log.write(f"[{capture.capture_id}] {message}\n")
+        if self._journal is not None:
+            self._journal.update_metadata(
+                capture.capture_id,
+                {
+                    "write_buffer_peak_bytes": buffer.peak_bytes,
+                    "write_buffer_full_waits": buffer.full_waits,
+                    "write_buffer_error": buffer.error,
+                },
+            )
+
+    async def _index_output(self, capture: _Capture) -> None:
+        # Matroska muxed to a pipe has no Cues, so every seek (proxy chunks,
+        # preview frames, players) would scan from the start. A stream copy
+        # writes the file again with an index.
+        if capture.write_buffer is None or capture.write_buffer.snapshot().error is not None:
+            return
+        output = Path(capture.output_file)
+        try:
+            size = output.stat().st_size
+            free = shutil.disk_usage(output.parent).free
+        except OSError:
+            return
+        if not size:
+            return
+        if free - size < self.disk_reserve_bytes:
+            message = f"Disk space is low; {output.name} left without a seek index."
+            capture.stderr_tail.append(message)
+            self._log.write(f"[{capture.capture_id}] {message}\n")
+            if self._journal is not None:
+                self._journal.update_metadata(capture.capture_id, {"seek_index": False})
             return
-        for line in process.stderr:
-            stripped = line.rstrip("\n")
-            self._stderr_tail.append(stripped)
-            log_handle.write(line)
-            log_handle.flush()
-        log_handle.write(f"\n== Capture end {dt.datetime.now().isoformat()} ==\n")
-        log_handle.flush()
-        log_handle.close()
-
-    def stop_capture(self) -> tuple[bool, str]:
-        with self._lock:
-            if not self.is_running():
-                return False, "No capture running."
-            assert self._process is not None
-            self._process.send_signal(signal.SIGINT)
+        indexed = output.with_name(f".{output.stem}.indexing{output.suffix}")
+        process = await asyncio.create_subprocess_exec(
+            *self.background_priority.wrap(build_index_command(str(output), str(indexed))),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # Shutdown: the recorded file is complete as it is.
+            process.kill()
+            indexed.unlink(missing_ok=True)
+            raise
+        if process.returncode != 0:
+            indexed.unlink(missing_ok=True)
+            message = f"Adding a seek index to {output.name} failed (exit {process.returncode}); file kept as recorded."
+            capture.stderr_tail.append(message)
+            self._log.write(f"[{capture.capture_id}] {message}\n{stderr.decode('utf-8', errors='replace')}\n")
+        else:
+            os.replace(indexed, output)
+        if self._journal is not None:
+            self._journal.update_metadata(capture.capture_id, {"seek_index": process.returncode == 0})
+
+    async def _notify(self, status: CaptureStatus) -> None:
+        for callback in self._listeners:
             try:
-                self._process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                self._process.kill()
-            return True, "Stop signal sent."
+                await callback(status)
+            except Exception:
+                logger.exception("Capture listener failed for %s", status.capture_id)
 
-    def status(self) -> CaptureStatus:
-        running = self.is_running()
-        return CaptureStatus(
-            running=running,
-            output_file=self._output_file,
-            started_at=self._started_at,
-            duration_seconds=self._duration_seconds,
-            stderr_tail=list(self._stderr_tail),
+    async def recover(self) -> None:
+        if self._journal is None:
+            return
+        async with self._lock:
+            for entry in self._journal.running():
+                pid = entry["pid"]
+                output_file = entry["output_file"]
+                if not pid or not output_file or not pid_matches(pid, output_file):
+                    logger.warning("Capture %s did not survive restart; marking interrupted", entry["capture_id"])
+                    self._journal.record_end(entry["capture_id"], STATE_INTERRUPTED, None)
+                    continue
+                options = options_from_dict(entry["options"])
+                capture = _Capture(
+                    entry["capture_id"],
+                    options,
+                    _AttachedProcess(pid, output_file),
+                    output_file,
+                    entry["duration_seconds"],
+                    started_at=dt.datetime.fromisoformat(entry["started_at"]),
+                    proxy_file=entry["metadata"].get("proxy_file"),
+                )
+                capture.stderr_tail.append("Reattached after restart; ffmpeg output is not available.")
+                self._captures[options.video_device] = capture
+                self._journal.update_metadata(capture.capture_id, {"reattached_at": dt.datetime.now().isoformat()})
+                capture.supervisor = asyncio.create_task(self._supervise(capture))
+                logger.info("Reattached capture %s (pid %s)", capture.capture_id, pid)
+            if self._running():
+                # Unattended captures that outlived a restart still need the
+                # low disk space stop.
+                self._ensure_watchdog()
+
+    def history(self, limit: int = 50) -> list[dict]:
+        if self._journal is None:
+            return []
+        return self._journal.recent(limit)
+
+    async def _read_stderr(self, capture: _Capture) -> None:
+        if capture.process.stderr is None:
+            return
+        async for line in iter_stream_lines(capture.process.stderr):
+            # One line per second of audio; kept out of the tail and the log.
+            if capture.drift is not None and capture.drift.feed(line):
+                continue
+            capture.stderr_tail.append(line)
+            self._log.write(f"[{capture.capture_id}] {line}\n")
+            if capture.end_of_tape is not None:
+                capture.end_of_tape.feed(line, time.monotonic())
+                self._check_end_of_tape(capture)
+            if capture.segment_dir is not None:
+                self._track_segment(capture, line)
+            if QUEUE_BLOCKING_PATTERN.search(line):
+                capture.queue_blocking_warnings += 1
+
+    def _pressure_level(self, video_device: str) -> int:
+        if video_device not in self._queue_pressure:
+            entry = self._journal.latest_for_device(video_device) if self._journal is not None else None
+            self._queue_pressure[video_device] = entry["metadata"].get("queue_pressure_level", 0) if entry else 0
+        return self._queue_pressure[video_device]
+
+    def _record_throughput(self, capture: _Capture) -> None:
+        if self._journal is None or capture.progress is None:
+            return
+        progress = capture.progress
+        values = {
+            "frames": progress.frame,
+            "fps": progress.fps,
+            "speed": progress.speed,
+            "drop_frames": progress.drop_frames,
+            "dup_frames": progress.dup_frames,
+            "total_size": progress.total_size,
+            "out_time_seconds": progress.out_time_seconds,
+            "cpu_cores": capture.cpu_cores,
+        }
+        if progress.out_time_seconds:
+            # Everything the capture wrote, proxy included, for admission control.
+            written = sum(
+                os.path.getsize(path)
+                for path in (capture.output_file, capture.proxy_file)
+                if path and os.path.exists(path)
+            )
+            values["bytes_per_second"] = written / progress.out_time_seconds if written else None
+        self._journal.update_metadata(capture.capture_id, values)
+
+    def _record_drift(self, capture: _Capture) -> None:
+        if self._journal is None or capture.drift is None or capture.drift.drift_ms is None:
+            return
+        self._journal.update_metadata(
+            capture.capture_id,
+            {
+                "av_drift_ms": round(capture.drift.drift_ms, 1),
+                "av_drift_ppm": round(capture.drift.drift_ppm, 1) if capture.drift.drift_ppm is not None else None,
+                "audio_resync": capture.options.audio_resync,
+            },
         )
 
+    def _sample_cpu(self, capture: _Capture) -> None:
+        elapsed = time.monotonic() - capture.launched_at
+        if elapsed < CPU_SAMPLE_MIN_SECONDS:
+            return
+        cpu_seconds = process_cpu_seconds(capture.process.pid)
+        if cpu_seconds is not None:
+            capture.cpu_cores = cpu_seconds / elapsed
+
+    def _record_queue_pressure(self, capture: _Capture) -> None:
+        if capture.queue_plan is None:
+            return
+        level = next_pressure_level(capture.queue_plan.pressure_level, capture.queue_blocking_warnings)
+        self._queue_pressure[capture.options.video_device] = level
+        if self._journal is not None:
+            self._journal.update_metadata(
+                capture.capture_id,
+                {"queue_blocking_warnings": capture.queue_blocking_warnings, "queue_pressure_level": level},
+            )
+
+    def _track_segment(self, capture: _Capture, line: str) -> None:
+        match = SEGMENT_OPEN_PATTERN.search(line)
+        if match is None:
+            return
+        path = Path(match.group(1))
+        if path.parent != capture.segment_dir or path.suffix != f".{capture.options.output_format}":
+            return
+        # ffmpeg opens segment N+1 only after closing segment N.
+        if capture.open_segment is not None:
+            self._close_segment(capture, capture.open_segment)
+        capture.open_segment = str(path)
+
+    def _close_segment(self, capture: _Capture, path: str) -> None:
+        capture.closed_segments.append(path)
+        task = asyncio.create_task(self._checksum_segment(path))
+        capture.segment_tasks.add(task)
+        task.add_done_callback(capture.segment_tasks.discard)
+
+    async def _checksum_segment(self, path: str) -> None:
+        try:
+            await asyncio.to_thread(write_checksum_sidecar, path)
+        except OSError:
+            logger.exception("Failed to checksum segment %s", path)
+
+    async def _finish_segments(self, capture: _Capture) -> None:
+        assert capture.segment_dir is not None
+        if capture.open_segment is not None:
+            self._close_segment(capture, capture.open_segment)
+            capture.open_segment = None
+        if capture.segment_tasks:
+            await asyncio.gather(*capture.segment_tasks, return_exceptions=True)
+        segment_list = capture.segment_dir / SEGMENT_LIST_NAME
+        if not segment_list.exists():
+            capture.stderr_tail.append("No segments were written; nothing to join.")
+            return
+        if capture.stop_reason == STOP_LOW_SPACE:
+            # Joining would write everything again; keep the closed segments
+            # and their list so they can be joined once space is freed.
+            capture.stderr_tail.append(f"Disk space is low; segments kept unjoined in {capture.segment_dir}.")
+            if self._journal is not None:
+                self._journal.update_metadata(
+                    capture.capture_id,
+                    {"segments": len(capture.closed_segments), "segments_unjoined": str(segment_list)},
+                )
+            return
+        # Every segment starts on a keyframe, so a stream copy joins them
+        # losslessly. Written under a hidden name so a half-joined file never
+        # shows up as the recording.
+        output = Path(capture.output_file)
+        joined = output.with_name(f".{output.stem}.partial{output.suffix}")
+        process = await asyncio.create_subprocess_exec(
+            *self.background_priority.wrap(build_concat_command(str(segment_list), str(joined))),
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            # Shutdown: the segments are kept and can be joined later.
+            process.kill()
+            joined.unlink(missing_ok=True)
+            raise
+        if process.returncode != 0:
+            joined.unlink(missing_ok=True)
+            message = f"Joining segments failed (exit {process.returncode}); segments kept in {capture.segment_dir}."
+            capture.stderr_tail.append(message)
+            self._log.write(f"[{capture.capture_id}] {message}\n{stderr.decode('utf-8', errors='replace')}\n")
+            if self._journal is not None:
+                self._journal.update_metadata(capture.capture_id, {"segment_join_failed": True})
+            return
+        os.replace(joined, output)
+        await asyncio.to_thread(write_checksum_sidecar, capture.output_file)
+        await asyncio.to_thread(shutil.rmtree, capture.segment_dir, True)
+        capture.stderr_tail.append(f"Joined {len(capture.closed_segments)} segments into {capture.output_file}.")
+        if self._journal is not None:
+            self._journal.update_metadata(capture.capture_id, {"segments": len(capture.closed_segments)})
+
+    async def _read_progress(self, capture: _Capture) -> None:
+        if capture.process.stdout is None:
+            return
+        parser = ProgressParser()
+        async for line in iter_stream_lines(capture.process.stdout):
+            progress = parser.feed(line)
+            if progress is not None:
+                if capture.progress is None or progress.frame > capture.progress.frame:
+                    capture.last_frame_at = time.monotonic()
+                    if capture.stalled_since is not None:
+                        self._record_stall_end(capture, resumed=True)
+                capture.progress = progress
+                self._sample_cpu(capture)
+                self._check_end_of_tape(capture)
+
+    def _ensure_watchdog(self) -> None:
+        if self._watchdog is None or self._watchdog.done():
+            self._watchdog = asyncio.create_task(self._watch_captures())
+
+    async def _watch_captures(self) -> None:
+        interval = max(min(self.stall_seconds / 3, 5.0), 0.5)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for capture in self._running():
+                # Reattached captures have no progress feed to judge by.
+                if isinstance(capture.process, _AttachedProcess) or capture.stop_reason is not None:
+                    continue
+                if capture.stalled_since is None and now - capture.last_frame_at >= self.stall_seconds:
+                    self._record_stall_start(capture, now)
+            self._check_disk_space()
+
+    def _check_disk_space(self) -> None:
+        disk = self.disk_space()
+        if disk is None or disk.free_bytes >= disk.reserve_bytes:
+            return
+        for capture in self._running():
+            if capture.stop_reason is not None:
+                continue
+            message = (
+                f"Only {disk.free_bytes / 1e9:.1f} GB left in {self.capture_dir}; "
+                "stopping capture so the file is finalized before the disk fills."
+            )
+            capture.stderr_tail.append(message)
+            self._log.write(f"[{capture.capture_id}] {message}\n")
+            if self._journal is not None:
+                elapsed = (dt.datetime.now() - capture.started_at).total_seconds()
+                self._journal.update_metadata(capture.capture_id, {"low_disk_space_at_seconds": int(elapsed)})
+            self._request_stop(capture, STOP_LOW_SPACE)
+
+    def _record_stall_start(self, capture: _Capture, now: float) -> None:
+        capture.stalled_since = dt.datetime.now() - dt.timedelta(seconds=now - capture.last_frame_at)
+        frame = capture.progress.frame if capture.progress else 0
+        message = f"No new frames since frame {frame} for {int(now - capture.last_frame_at)} s; capture looks stalled."
+        capture.stderr_tail.append(message)
+        self._log.write(f"[{capture.capture_id}] {message}\n")
+        logger.warning("Capture %s stalled on %s", capture.capture_id, capture.options.video_device)
+        if self.stall_restart:
+            self._request_stop(capture, STOP_STALLED)
+
+    def _record_stall_end(self, capture: _Capture, resumed: bool) -> None:
+        assert capture.stalled_since is not None
+        gap = {
+            "started_at": capture.stalled_since.isoformat(),
+            "ended_at": dt.datetime.now().isoformat(),
+            "frame": capture.progress.frame if capture.progress else 0,
+            "resumed": resumed,
+        }
+        if resumed:
+            capture.stalled_since = None
+            capture.stderr_tail.append(f"Frames resumed after stall starting {gap['started_at']}.")
+        self._append_gap(capture, gap)
+
+    def _append_gap(self, capture: _Capture, gap: dict) -> None:
+        if self._journal is None:
+            return
+        entry = self._journal.get(capture.capture_id)
+        gaps = entry["metadata"].get("gaps", []) if entry else []
+        self._journal.update_metadata(capture.capture_id, {"gaps": gaps + [gap]})
+
+    async def _continue_capture(self, capture: _Capture) -> None:
+        elapsed = int((dt.datetime.now() - capture.started_at).total_seconds())
+        remaining = capture.duration_seconds - elapsed
+        gap = {
+            "started_at": capture.stalled_since.isoformat() if capture.stalled_since else None,
+            "ended_at": dt.datetime.now().isoformat(),
+            "frame": capture.progress.frame if capture.progress else 0,
+            "restarted": remaining > 0,
+        }
+        self._append_gap(capture, gap)
+        if remaining <= 0:
+            return
+        options = dataclasses.replace(capture.options, duration_seconds=remaining, test_preview=False)
+        success, message, output_file, capture_id = await self.start_capture(options)
+        if not success:
+            capture.stderr_tail.append(f"Restart after stall failed: {message}")
+            return
+        capture.continued_by = capture_id
+        assert capture_id is not None
+        continuation = self._find(capture_id)
+        if continuation is not None:
+            continuation.continues = capture
+        capture.stderr_tail.append(f"Restarted as capture {capture_id} writing {output_file}.")
+        if self._journal is not None:
+            self._journal.update_metadata(capture.capture_id, {"continued_by": capture_id})
+            self._journal.update_metadata(capture_id, {"continues": capture.capture_id})
+
+    def _check_end_of_tape(self, capture: _Capture) -> None:
+        if capture.end_of_tape is None or capture.stop_reason is not None or not capture.is_running():
+            return
+        if not capture.end_of_tape.triggered(time.monotonic()):
+            return
+        message = f"No signal for {capture.end_of_tape.hold_seconds} s; stopping capture at end of tape."
+        capture.stderr_tail.append(message)
+        self._log.write(f"[{capture.capture_id}] {message}\n")
+        if self._journal is not None:
+            elapsed = (dt.datetime.now() - capture.started_at).total_seconds()
+            self._journal.update_metadata(capture.capture_id, {"end_of_tape_at_seconds": int(elapsed)})
+        self._request_stop(capture, STOP_END_OF_TAPE)
+
+    async def stop_capture(self, ref: str | None = None) -> tuple[bool, str]:
+        async with self._lock:
+            if ref is None:
+                running = self._running()
+                if not running:
+                    return False, "No capture running."
+                if len(running) > 1:
+                    return False, "Several captures are running; specify a capture or device id."
+                capture = running[0]
+            else:
+                capture = self._find(ref)
+                if capture is None or not capture.is_running():
+                    return False, f"No capture running for {ref}."
+            if capture.stop_reason is not None:
+                return True, f"Capture {capture.capture_id} is already stopping."
+            self._request_stop(capture, STOP_OPERATOR)
+            return True, f"Stopping capture {capture.capture_id}."
+
+    def _request_stop(self, capture: _Capture, reason: str) -> None:
+        capture.stop_reason = reason
+        capture.stop_task = asyncio.create_task(self._stop_gracefully(capture))
+
+    async def _stop_gracefully(self, capture: _Capture) -> None:
+        # Escalate: "q" on stdin (ffmpeg finishes and writes the trailer),
+        # then SIGINT, then SIGKILL. Completion shows up through status().
+        process = capture.process
+        stdin = getattr(process, "stdin", None)
+        if stdin is not None and not stdin.is_closing():
+            try:
+                stdin.write(b"q")
+                await stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            if await self._wait_for_exit(process, self.stop_grace_seconds):
+                return
+        if not capture.is_running():
+            return
+        process.send_signal(signal.SIGINT)
+        if await self._wait_for_exit(process, 5):
+            return
+        capture.stderr_tail.append("ffmpeg ignored the stop request; killing it.")
+        process.kill()
+
+    async def _wait_for_exit(self, process, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(process.wait()), timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def close(self) -> None:
+        # A buffered capture cannot outlive the service: its output pipe ends
+        # here. Stop those cleanly so the buffer is written out first.
+        buffered = [capture for capture in self._running() if capture.write_buffer is not None]
+        for capture in buffered:
+            if capture.stop_reason is None:
+                self._request_stop(capture, STOP_SHUTDOWN)
+        supervisors = [capture.supervisor for capture in buffered if capture.supervisor is not None]
+        if supervisors:
+            await asyncio.wait(supervisors, timeout=self.stop_grace_seconds + 10)
+        tasks = [capture.supervisor for capture in self._captures.values() if capture.supervisor is not None]
+        if self._watchdog is not None:
+            tasks.append(self._watchdog)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._log.close()
+        if self._journal is not None:
+            self._journal.close()
+
+    def status(self, ref: str) -> CaptureStatus | None:
+        capture = self._find(ref)
+        if capture is None:
+            return None
+        return capture.status()
+
+    def statuses(self) -> list[CaptureStatus]:
+        return [capture.status() for capture in self._with_predecessors()]
+
+
+def options_from_dict(values: dict) -> CaptureOptions:
+    known = {field.name for field in dataclasses.fields(CaptureOptions)}
+    return CaptureOptions(**{key: value for key, value in values.items() if key in known})
+
+
+def invalid_options(options: CaptureOptions) -> str | None:
+    # Refusals that no amount of waiting for other captures would change.
+    if options.auto_stop_seconds and options.preset == "passthrough_if_possible":
+        return "Auto-stop needs a re-encoding preset; passthrough cannot run detection filters."
+    if options.audio_resync and options.preset == "passthrough_if_possible":
+        return "Audio resync needs a re-encoding preset; passthrough copies the audio as is."
+    if not options.dry_run and options.video_device.startswith("/dev/") and not os.path.exists(options.video_device):
+        return f"Video device {options.video_device} not found."
+    return None
+
+
+def pid_matches(pid: int, output_file: str) -> bool:
+    try:
+        cmdline = Path(f"/proc/{pid}/cmdline").read_bytes()
+    except OSError:
+        return False
+    args = [part.decode("utf-8", errors="replace") for part in cmdline.split(b"\0") if part]
+    if not args or Path(args[0]).name != "ffmpeg":
+        return False
+    segments = str(segment_dir(output_file))
+    return any(arg == output_file or arg.startswith(segments) for arg in args)
+
 
 def parse_duration(value: str) -> int:
     if not value:
@@ -178,7 +1187,14 @@ def list_audio_devices() -> list[tuple[str, str]]:
     return devices
 
 
-def build_output_path(output_dir: str, prefix: str, tape_label: str | None, output_format: str) -> str:
+def build_output_path(
+    output_dir: str,
+    prefix: str,
+    tape_label: str | None,
+    output_format: str,
+    staging_dir: str | None = None,
+    taken: set[str] | frozenset[str] = frozenset(),
+) -> str:
     safe_prefix = sanitize_filename(prefix or "capture")
     label = sanitize_filename(tape_label) if tape_label else ""
     timestamp = dt.datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -186,8 +1202,40 @@ def build_output_path(output_dir: str, prefix: str, tape_label: str | None, outp
     if label:
         parts.append(label)
     parts.append(timestamp)
-    filename = "_".join(filter(None, parts)) + f".{output_format}"
-    return str(Path(output_dir) / filename)
+    base = "_".join(filter(None, parts))
+    # Active captures go to the staging volume when there is one; the
+    # finished files are migrated to output_dir afterwards.
+    directory = Path(staging_dir or output_dir)
+    # Decks started together (queue dispatch, a shared schedule time) land
+    # in the same second; later ones get a numbered suffix.
+    candidate = directory / f"{base}.{output_format}"
+    attempt = 1
+    while output_name_taken(candidate, output_dir, taken):
+        attempt += 1
+        candidate = directory / f"{base}_{attempt}.{output_format}"
+    return str(candidate)
+
+
+def output_name_taken(candidate: Path, output_dir: str, taken: set[str] | frozenset[str]) -> bool:
+    # The proxy and segment directory derive from the same stem, so they
+    # must be free too, in staging and in the archive.
+    if str(candidate) in taken:
+        return True
+    derived = (candidate, Path(build_proxy_path(str(candidate))), segment_dir(str(candidate)))
+    for directory in {candidate.parent, Path(output_dir)}:
+        if any((directory / path.name).exists() for path in derived):
+            return True
+    return False
+
+
+def build_proxy_path(output_file: str) -> str:
+    path = Path(output_file)
+    return str(path.with_name(f"{path.stem}_proxy.mp4"))
+
+
+def segment_dir(output_file: str) -> Path:
+    path = Path(output_file)
+    return path.with_name(f"{path.stem}.parts")
 
 
 def sanitize_filename(value: str) -> str:
@@ -199,45 +1247,192 @@ def ensure_directory(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def set_input_type(video_device: str, input_type: str) -> None:
+async def set_input_type(video_device: str, input_type: str) -> None:
     if input_type not in {"composite", "s-video"}:
         return
     index = "0" if input_type == "composite" else "1"
     try:
-        subprocess.run(["v4l2-ctl", "--device", video_device, "--set-input", index], check=False)
+        process = await asyncio.create_subprocess_exec("v4l2-ctl", "--device", video_device, "--set-input", index)
     except FileNotFoundError:
         logger.warning("v4l2-ctl not available to set input type")
+        return
+    await process.wait()
+
+
+async def iter_stream_lines(stream: asyncio.StreamReader) -> AsyncIterator[str]:
+    # ffmpeg terminates its periodic stats line with "\r", so split on both.
+    pending = b""
+    while True:
+        chunk = await stream.read(4096)
+        if not chunk:
+            break
+        pending += chunk
+        parts = re.split(rb"[\r\n]", pending)
+        pending = parts.pop()
+        for part in parts:
+            if part:
+                yield part.decode("utf-8", errors="replace")
+    if pending:
+        yield pending.decode("utf-8", errors="replace")
 
 
-def build_ffmpeg_command(options: CaptureOptions, duration: int, output_file: str) -> list[str]:
+def build_ffmpeg_command(
+    options: CaptureOptions,
+    duration: int,
+    output_file: str,
+    proxy_file: str | None = None,
+    profile: InputProfile | None = None,
+    queue_plan: QueuePlan | None = None,
+    encoder_threads: EncoderThreads | None = None,
+) -> list[str]:
+    video_queue = str(queue_plan.video_packets) if queue_plan else "4096"
+    audio_queue = str(queue_plan.audio_packets) if queue_plan else "4096"
     cmd = [
         "ffmpeg",
         "-hide_banner",
         "-loglevel",
         "info",
+        "-nostats",
+        "-progress",
+        "pipe:1",
         "-f",
         "v4l2",
         "-thread_queue_size",
-        "4096",
-        "-i",
-        options.video_device,
+        video_queue,
+    ]
+    if profile is not None:
+        # Pin the negotiated mode instead of letting ffmpeg pick (e.g. MJPEG).
+        cmd.extend(profile.ffmpeg_args())
+    cmd.extend(
+        [
+            "-i",
+            options.video_device,
+            "-f",
+            "alsa",
+            "-thread_queue_size",
+            audio_queue,
+            "-i",
+            options.audio_device,
+        ]
+    )
+    if proxy_file:
+        # Output options apply per output, so each one maps the streams and
+        # carries its own duration limit; both share one decode of the inputs.
+        cmd.extend(["-map", "0:v", "-map", "1:a"])
+    cmd.extend(["-t", str(duration)])
+    cmd.extend(capture_filters(options))
+    cmd.extend(encode_flags(options.preset, encoder_threads))
+    if options.segment_seconds:
+        cmd.extend(segment_flags(output_file, options.output_format, options.segment_seconds))
+    else:
+        cmd.append(output_file)
+    if proxy_file:
+        cmd.extend(["-map", "0:v", "-map", "1:a", "-t", str(duration)])
+        cmd.extend(proxy_flags(encoder_threads.proxy_threads if encoder_threads else None, options.audio_resync))
+        cmd.append(proxy_file)
+    return cmd
+
+
+def pipe_output(cmd: list[str], output_file: str, fd: int) -> list[str]:
+    # Same command, with the main output sent to an inherited pipe instead of the file.
+    index = cmd.index(output_file)
+    return cmd[:index] + ["-f", "matroska", f"pipe:{fd}"] + cmd[index + 1 :]
+
+
+def segment_flags(output_file: str, output_format: str, segment_seconds: int) -> list[str]:
+    parts = segment_dir(output_file)
+    stem = Path(output_file).stem
+    return [
         "-f",
-        "alsa",
-        "-thread_queue_size",
-        "4096",
+        "segment",
+        "-segment_time",
+        str(segment_seconds),
+        "-segment_format",
+        "matroska" if output_format == "mkv" else output_format,
+        "-reset_timestamps",
+        "1",
+        "-segment_list",
+        str(parts / SEGMENT_LIST_NAME),
+        "-segment_list_type",
+        "ffconcat",
+        str(parts / f"{stem}_%05d.{output_format}"),
+    ]
+
+
+def build_concat_command(segment_list: str, output_file: str) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
         "-i",
-        options.audio_device,
-        "-t",
-        str(duration),
+        segment_list,
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        output_file,
     ]
-    cmd.extend(encode_flags(options.preset))
-    cmd.append(output_file)
-    return cmd
 
 
-def encode_flags(preset: str) -> list[str]:
-    if preset == "archival_lossless":
-        return [
+def build_index_command(source: str, output: str) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-i",
+        source,
+        "-map",
+        "0",
+        "-c",
+        "copy",
+        output,
+    ]
+
+
+def end_of_tape_filters() -> tuple[str, str]:
+    # blackdetect tags the first black frame with lavfi.black_start (and the
+    # first picture after it with lavfi.black_end); metadata=print logs those
+    # tags. pix_th=0.15 also classes a VCR's blue no-signal screen as black.
+    # silencedetect logs silence_start once audio stays below the noise floor.
+    return "blackdetect=d=0:pix_th=0.15,metadata=mode=print", "silencedetect=noise=-50dB:d=2"
+
+
+def measures_drift(options: CaptureOptions) -> bool:
+    return options.preset != "passthrough_if_possible"
+
+
+def capture_filters(options: CaptureOptions) -> list[str]:
+    video: list[str] = []
+    audio: list[str] = []
+    if measures_drift(options):
+        # One-second frames at 48 kHz (the last one not padded) so ashowinfo
+        # logs about once a second; measured before any correction.
+        audio.extend(["asetnsamples=n=48000:p=0", "ashowinfo"])
+    if options.audio_resync:
+        audio.append(RESYNC_FILTER)
+    if options.auto_stop_seconds:
+        black, silence = end_of_tape_filters()
+        video.append(black)
+        audio.append(silence)
+    filters = []
+    if video:
+        filters.extend(["-vf", ",".join(video)])
+    if audio:
+        filters.extend(["-af", ",".join(audio)])
+    return filters
+
+
+def encode_flags(preset: str, threads: EncoderThreads | None = None) -> list[str]:
+    if preset in {"archival_lossless", "archival_with_proxy"}:
+        flags = [
             "-c:v",
             "ffv1",
             "-level",
@@ -246,12 +1441,13 @@ def encode_flags(preset: str) -> list[str]:
             "1",
             "-slicecrc",
             "1",
-            "-c:a",
-            "flac",
         ]
+        if threads is not None:
+            flags.extend(["-threads:v", str(threads.threads), "-slices", str(threads.slices)])
+        return flags + ["-c:a", "flac"]
     if preset == "passthrough_if_possible":
         return ["-c:v", "copy", "-c:a", "copy"]
-    return [
+    flags = [
         "-c:v",
         "libx264",
         "-preset",
@@ -260,11 +1456,36 @@ def encode_flags(preset: str) -> list[str]:
         "18",
         "-pix_fmt",
         "yuv420p",
-        "-c:a",
-        "aac",
-        "-b:a",
-        "192k",
     ]
+    if threads is not None:
+        flags.extend(["-threads:v", str(threads.threads)])
+    return flags + ["-c:a", "aac", "-b:a", "192k"]
+
+
+def proxy_flags(threads: int | None = None, audio_resync: bool = False) -> list[str]:
+    flags = ["-threads:v", str(threads)] if threads else []
+    if audio_resync:
+        flags.extend(["-af", RESYNC_FILTER])
+    return flags + proxy_video_flags() + proxy_audio_flags() + ["-movflags", "+faststart"]
+
+
+def proxy_video_flags() -> list[str]:
+    return [
+        "-vf",
+        "yadif,scale=-2:360",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-crf",
+        "28",
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+
+def proxy_audio_flags() -> list[str]:
+    return ["-c:a", "aac", "-b:a", "96k"]
 
 
 def format_duration(seconds: int | None) -> str:
@@ -273,20 +1494,41 @@ def format_duration(seconds: int | None) -> str:
     return str(dt.timedelta(seconds=seconds))
 
 
-def iter_recent_recordings(output_dir: str) -> Iterable[dict]:
-    path = Path(output_dir)
-    if not path.exists():
-        return []
-    items = []
-    for file in path.iterdir():
-        if file.name == "vhs-ui.log" or not file.is_file():
+def iter_recent_recordings(output_dir: str, staging_dir: str | None = None) -> Iterable[dict]:
+    items: dict[str, dict] = {}
+    # Archive first: while a file is being migrated it exists in both places
+    # for a moment, and the archived copy wins.
+    for directory, staged in ((output_dir, False), (staging_dir, True)):
+        if not directory:
             continue
-        stat = file.stat()
-        items.append(
-            {
+        path = Path(directory)
+        if not path.exists():
+            continue
+        for file in path.iterdir():
+            # Hidden files hold service state such as the capture journal or
+            # copies still being migrated.
+            if file.name == "vhs-ui.log" or file.name.startswith(".") or not file.is_file():
+                continue
+            if file.name.endswith(SIDECAR_SUFFIX) or file.name in items:
+                continue
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            items[file.name] = {
                 "name": file.name,
                 "size": stat.st_size,
                 "mtime": dt.datetime.fromtimestamp(stat.st_mtime),
+                "staged": staged,
             }
-        )
-    return sorted(items, key=lambda entry: entry["mtime"], reverse=True)
+    return sorted(items.values(), key=lambda entry: entry["mtime"], reverse=True)
+
+
+def resolve_recording(filename: str, output_dir: str, staging_dir: str | None = None) -> Path | None:
+    safe_name = os.path.basename(filename)
+    if not safe_name or safe_name.startswith("."):
+        return None
+    for directory in (output_dir, staging_dir):
+        if directory and (Path(directory) / safe_name).is_file():
+            return Path(directory) / safe_name
+    return None
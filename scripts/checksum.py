@@ -0,0 +1,25 @@
+import hashlib
+from pathlib import Path
+
+CHUNK_SIZE = 4 * 1024 * 1024
+SIDECAR_SUFFIX = ".sha256"
+
+
+def sha256_file(path: str | Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while chunk := handle.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sidecar_path(path: str | Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.name + SIDECAR_SUFFIX)
+
+
+def write_checksum_sidecar(path: str | Path, digest: str | None = None) -> str:
+    # Same layout as sha256sum output so `sha256sum -c` can verify it.
+    digest = digest or sha256_file(path)
+    sidecar_path(path).write_text(f"{digest}  {Path(path).name}\n", encoding="utf-8")
+    return digest
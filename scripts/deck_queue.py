@@ -0,0 +1,128 @@
+import asyncio
+import dataclasses
+import datetime as dt
+import logging
+import uuid
+from collections import deque
+
+from scripts.capture import CaptureManager, CaptureOptions, CaptureStatus, invalid_options
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class QueuedJob:
+    job_id: str
+    options: CaptureOptions
+    ready: bool
+    created_at: dt.datetime
+    last_error: str | None = None
+
+
+class DeckQueue:
+    def __init__(self, manager: CaptureManager) -> None:
+        self._manager = manager
+        self._lock = asyncio.Lock()
+        # FIFO per video device; the head job starts once the deck is idle
+        # and the operator has confirmed its tape is loaded.
+        self._queues: dict[str, list[QueuedJob]] = {}
+        # Jobs dropped because they can never start, kept for the status page.
+        self._failed: deque[QueuedJob] = deque(maxlen=50)
+        manager.add_listener(self._on_capture_end)
+
+    def jobs(self, video_device: str | None = None) -> list[QueuedJob]:
+        if video_device is not None:
+            return list(self._queues.get(video_device, []))
+        return [job for queue in self._queues.values() for job in queue]
+
+    def failed_jobs(self) -> list[QueuedJob]:
+        return list(self._failed)
+
+    async def enqueue(self, options: CaptureOptions, ready: bool = False) -> QueuedJob:
+        job = QueuedJob(
+            job_id=uuid.uuid4().hex[:12],
+            options=options,
+            ready=ready,
+            created_at=dt.datetime.now(),
+        )
+        async with self._lock:
+            self._queues.setdefault(options.video_device, []).append(job)
+        await self.dispatch(options.video_device)
+        return job
+
+    async def confirm(self, job_id: str) -> tuple[bool, str]:
+        async with self._lock:
+            job = self._find(job_id)
+            if job is None:
+                return False, f"Queued job {job_id} not found."
+            job.ready = True
+        await self.dispatch(job.options.video_device)
+        return True, f"Tape confirmed for job {job_id}."
+
+    async def move(self, job_id: str, position: int) -> tuple[bool, str]:
+        async with self._lock:
+            job = self._find(job_id)
+            if job is None:
+                return False, f"Queued job {job_id} not found."
+            queue = self._queues[job.options.video_device]
+            queue.remove(job)
+            position = min(max(position, 0), len(queue))
+            queue.insert(position, job)
+        await self.dispatch(job.options.video_device)
+        return True, f"Job {job_id} moved to position {position}."
+
+    async def cancel(self, job_id: str) -> tuple[bool, str]:
+        async with self._lock:
+            job = self._find(job_id)
+            if job is None:
+                return False, f"Queued job {job_id} not found."
+            self._queues[job.options.video_device].remove(job)
+        return True, f"Job {job_id} cancelled."
+
+    async def dispatch(self, video_device: str) -> None:
+        async with self._lock:
+            queue = self._queues.get(video_device)
+            while queue and queue[0].ready and not self._manager.is_running(video_device):
+                job = queue[0]
+                problem = invalid_options(job.options)
+                if problem is not None:
+                    # Would be refused the same way on every retry and block the deck.
+                    self._drop(queue, job, problem)
+                    continue
+                try:
+                    success, message, output_file, capture_id = await self._manager.start_capture(job.options)
+                except Exception as exc:
+                    logger.exception("Queued job %s on %s failed to start", job.job_id, video_device)
+                    self._drop(queue, job, f"Failed to start: {exc}")
+                    continue
+                if not success:
+                    # Busy deck or audio device, CPU, bandwidth or space: retried
+                    # when another capture ends.
+                    job.last_error = message
+                    logger.warning("Queued job %s on %s not started: %s", job.job_id, video_device, message)
+                    return
+                queue.pop(0)
+                logger.info("Queued job %s started as capture %s", job.job_id, capture_id)
+                return
+
+    def _drop(self, queue: list[QueuedJob], job: QueuedJob, error: str) -> None:
+        queue.remove(job)
+        job.last_error = error
+        self._failed.append(job)
+        logger.warning("Queued job %s on %s dropped: %s", job.job_id, job.options.video_device, error)
+
+    async def _on_capture_end(self, status: CaptureStatus) -> None:
+        # A finished capture can also free an audio device used by another
+        # deck, so every queue gets a chance to start its head job.
+        for video_device in list(self._queues):
+            try:
+                await self.dispatch(video_device)
+            except Exception:
+                logger.exception("Dispatching the queue of %s failed", video_device)
+
+    def _find(self, job_id: str) -> QueuedJob | None:
+        for queue in self._queues.values():
+            for job in queue:
+                if job.job_id == job_id:
+                    return job
+        return None
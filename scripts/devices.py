@@ -0,0 +1,192 @@
+import asyncio
+import dataclasses
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# v4l2 fourcc -> ffmpeg -input_format name, in order of preference. Raw
+# formats come first so ffmpeg never has to decode MJPEG from an SD deck.
+PIXEL_FORMATS = {
+    "YUYV": "yuyv422",
+    "UYVY": "uyvy422",
+    "NV12": "nv12",
+    "YU12": "yuv420p",
+    "MJPG": "mjpeg",
+}
+
+STANDARD_MODES = {
+    "NTSC": ((720, 480), "30000/1001"),
+    "PAL": ((720, 576), "25"),
+    "SECAM": ((720, 576), "25"),
+}
+
+FORMAT_PATTERN = re.compile(r"\[\d+\]: '(\w+)'")
+SIZE_PATTERN = re.compile(r"Size: \w+ (\d+)x(\d+)")
+INTERVAL_PATTERN = re.compile(r"Interval: \w+ [\d.]+s \(([\d.]+) fps\)")
+STANDARD_NAME_PATTERN = re.compile(r"Name\s*:\s*(\S+)")
+
+
+@dataclasses.dataclass
+class VideoMode:
+    pixel_format: str
+    width: int
+    height: int
+    fps: list[float]
+
+
+@dataclasses.dataclass
+class DeviceCapabilities:
+    device: str
+    modes: list[VideoMode]
+    standards: list[str]
+    current_standard: str | None
+
+
+@dataclasses.dataclass
+class InputProfile:
+    input_format: str
+    video_size: str
+    framerate: str
+    standard: str | None
+
+    def ffmpeg_args(self) -> list[str]:
+        args = []
+        if self.standard:
+            args.extend(["-standard", self.standard])
+        args.extend(
+            [
+                "-input_format",
+                self.input_format,
+                "-video_size",
+                self.video_size,
+                "-framerate",
+                self.framerate,
+            ]
+        )
+        return args
+
+
+class DeviceCatalog:
+    def __init__(self) -> None:
+        self._cache: dict[str, DeviceCapabilities] = {}
+        self._lock = asyncio.Lock()
+
+    async def capabilities(self, device: str, refresh: bool = False) -> DeviceCapabilities | None:
+        async with self._lock:
+            if refresh or device not in self._cache:
+                capabilities = await probe_device(device)
+                if capabilities is None:
+                    return None
+                self._cache[device] = capabilities
+            return self._cache[device]
+
+    async def profile(self, device: str, standard: str = "auto") -> InputProfile | None:
+        capabilities = await self.capabilities(device)
+        if capabilities is None:
+            return None
+        return choose_profile(capabilities, standard)
+
+
+async def probe_device(device: str) -> DeviceCapabilities | None:
+    formats = await _v4l2_ctl(device, "--list-formats-ext")
+    if formats is None:
+        return None
+    standards = await _v4l2_ctl(device, "--list-standards") or ""
+    current = await _v4l2_ctl(device, "--get-standard") or ""
+    return DeviceCapabilities(
+        device=device,
+        modes=parse_formats(formats),
+        standards=STANDARD_NAME_PATTERN.findall(standards),
+        current_standard=parse_current_standard(current),
+    )
+
+
+async def _v4l2_ctl(device: str, *args: str) -> str | None:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "v4l2-ctl",
+            "--device",
+            device,
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+    except FileNotFoundError:
+        logger.warning("v4l2-ctl not available to probe %s", device)
+        return None
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    return stdout.decode("utf-8", errors="replace")
+
+
+def parse_formats(output: str) -> list[VideoMode]:
+    modes: list[VideoMode] = []
+    pixel_format = None
+    for line in output.splitlines():
+        if match := FORMAT_PATTERN.search(line):
+            pixel_format = match.group(1)
+        elif (match := SIZE_PATTERN.search(line)) and pixel_format:
+            modes.append(VideoMode(pixel_format, int(match.group(1)), int(match.group(2)), []))
+        elif (match := INTERVAL_PATTERN.search(line)) and modes:
+            modes[-1].fps.append(float(match.group(1)))
+    return modes
+
+
+def parse_current_standard(output: str) -> str | None:
+    # "Video Standard = 0x0000b000\n\tNTSC-M/M-JP/M-KR"
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    if len(lines) < 2:
+        return None
+    return standard_family(lines[1])
+
+
+def standard_family(name: str) -> str | None:
+    upper = name.upper()
+    for family in STANDARD_MODES:
+        if upper.startswith(family):
+            return family
+    return None
+
+
+def choose_profile(capabilities: DeviceCapabilities, standard: str = "auto") -> InputProfile | None:
+    family = standard_family(standard) if standard != "auto" else None
+    family = family or capabilities.current_standard or "NTSC"
+    (width, height), framerate = STANDARD_MODES[family]
+    candidates = [mode for mode in capabilities.modes if mode.pixel_format in PIXEL_FORMATS]
+    if not candidates:
+        return None
+    preference = list(PIXEL_FORMATS)
+    candidates.sort(
+        key=lambda mode: (
+            (mode.width, mode.height) != (width, height),
+            mode.height != height,
+            preference.index(mode.pixel_format),
+        )
+    )
+    mode = candidates[0]
+    target_fps = _fps_value(framerate)
+    if mode.fps and all(abs(fps - target_fps) > 0.05 for fps in mode.fps):
+        framerate = _fps_fraction(min(mode.fps, key=lambda fps: abs(fps - target_fps)))
+    standards: dict[str | None, str] = {}
+    for name in capabilities.standards:
+        standards.setdefault(standard_family(name), name)
+    return InputProfile(
+        input_format=PIXEL_FORMATS[mode.pixel_format],
+        video_size=f"{mode.width}x{mode.height}",
+        framerate=framerate,
+        standard=standards.get(family),
+    )
+
+
+def _fps_value(fraction: str) -> float:
+    numerator, _, denominator = fraction.partition("/")
+    return float(numerator) / float(denominator or 1)
+
+
+def _fps_fraction(fps: float) -> str:
+    for rate in (24000 / 1001, 30000 / 1001, 60000 / 1001):
+        if abs(fps - rate) < 0.01:
+            return f"{round(rate * 1001)}/1001"
+    return f"{fps:g}"
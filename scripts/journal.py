@@ -0,0 +1,162 @@
+import datetime as dt
+import json
+import sqlite3
+import threading
+from typing import Any
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    capture_id TEXT PRIMARY KEY,
+    video_device TEXT NOT NULL,
+    options TEXT NOT NULL,
+    pid INTEGER,
+    output_file TEXT,
+    duration_seconds INTEGER,
+    state TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    ended_at TEXT,
+    return_code INTEGER,
+    metadata TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS captures_state ON captures (state);
+CREATE TABLE IF NOT EXISTS schedules (
+    schedule_id TEXT PRIMARY KEY,
+    options TEXT NOT NULL,
+    run_at TEXT NOT NULL,
+    repeat_seconds INTEGER
+);
+"""
+
+STATE_RUNNING = "running"
+STATE_COMPLETED = "completed"
+STATE_FAILED = "failed"
+STATE_STOPPED = "stopped"
+STATE_INTERRUPTED = "interrupted"
+STATE_STALLED = "stalled"
+
+
+class CaptureJournal:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+
+    def record_start(
+        self,
+        capture_id: str,
+        video_device: str,
+        options: dict[str, Any],
+        pid: int,
+        output_file: str,
+        duration_seconds: int,
+        started_at: dt.datetime,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO captures "
+                "(capture_id, video_device, options, pid, output_file, duration_seconds, state, started_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    capture_id,
+                    video_device,
+                    json.dumps(options),
+                    pid,
+                    output_file,
+                    duration_seconds,
+                    STATE_RUNNING,
+                    started_at.isoformat(),
+                ),
+            )
+
+    def record_end(self, capture_id: str, state: str, return_code: int | None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE captures SET state = ?, ended_at = ?, return_code = ? WHERE capture_id = ?",
+                (state, dt.datetime.now().isoformat(), return_code, capture_id),
+            )
+
+    def update_metadata(self, capture_id: str, values: dict[str, Any]) -> None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT metadata FROM captures WHERE capture_id = ?", (capture_id,)
+            ).fetchone()
+            if row is None:
+                return
+            metadata = json.loads(row["metadata"])
+            metadata.update(values)
+            self._conn.execute(
+                "UPDATE captures SET metadata = ? WHERE capture_id = ?",
+                (json.dumps(metadata), capture_id),
+            )
+
+    def get(self, capture_id: str) -> dict[str, Any] | None:
+        entries = self._select("SELECT * FROM captures WHERE capture_id = ?", (capture_id,))
+        return entries[0] if entries else None
+
+    def latest_for_device(self, video_device: str) -> dict[str, Any] | None:
+        entries = self._select(
+            "SELECT * FROM captures WHERE video_device = ? AND state != ? ORDER BY started_at DESC LIMIT 1",
+            (video_device, STATE_RUNNING),
+        )
+        return entries[0] if entries else None
+
+    def running(self) -> list[dict[str, Any]]:
+        return self._select("SELECT * FROM captures WHERE state = ? ORDER BY started_at", (STATE_RUNNING,))
+
+    def recent(self, limit: int = 50) -> list[dict[str, Any]]:
+        return self._select("SELECT * FROM captures ORDER BY started_at DESC LIMIT ?", (limit,))
+
+    def measured(self, preset: str, limit: int = 10) -> list[dict[str, Any]]:
+        # Finished captures of a preset that recorded their CPU and write rates.
+        return self._select(
+            "SELECT * FROM captures WHERE state IN (?, ?) AND json_extract(options, '$.preset') = ? "
+            "AND json_extract(metadata, '$.bytes_per_second') IS NOT NULL ORDER BY started_at DESC LIMIT ?",
+            (STATE_COMPLETED, STATE_STOPPED, preset, limit),
+        )
+
+    def save_schedule(
+        self,
+        schedule_id: str,
+        options: dict[str, Any],
+        run_at: dt.datetime,
+        repeat_seconds: int | None,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO schedules (schedule_id, options, run_at, repeat_seconds) VALUES (?, ?, ?, ?)",
+                (schedule_id, json.dumps(options), run_at.isoformat(), repeat_seconds),
+            )
+
+    def delete_schedule(self, schedule_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM schedules WHERE schedule_id = ?", (schedule_id,))
+
+    def schedules(self) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM schedules ORDER BY run_at").fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["options"] = json.loads(entry["options"])
+            entry["run_at"] = dt.datetime.fromisoformat(entry["run_at"])
+            entries.append(entry)
+        return entries
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _select(self, query: str, params: tuple) -> list[dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["options"] = json.loads(entry["options"])
+            entry["metadata"] = json.loads(entry["metadata"])
+            entries.append(entry)
+        return entries
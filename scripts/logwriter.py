@@ -0,0 +1,101 @@
+import asyncio
+import atexit
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedLogWriter:
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        flush_bytes: int = 64 * 1024,
+        max_pending_bytes: int = 4 * 1024 * 1024,
+    ) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_pending_bytes = max_pending_bytes
+        self._pending: deque[str] = deque()
+        self._pending_bytes = 0
+        self._dropped = 0
+        self._handle = None
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._write_lock = asyncio.Lock()
+        atexit.register(self.flush_sync)
+
+    def write(self, text: str) -> None:
+        size = len(text)
+        # Bounded queue: when the disk cannot keep up, drop the oldest lines
+        # rather than growing without limit or blocking the event loop.
+        while self._pending and self._pending_bytes + size > self.max_pending_bytes:
+            self._pending_bytes -= len(self._pending.popleft())
+            self._dropped += 1
+        self._pending.append(text)
+        self._pending_bytes += size
+        self._ensure_task()
+        if self._pending_bytes >= self.flush_bytes and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self) -> None:
+        async with self._write_lock:
+            batch = self._take_batch()
+            if batch:
+                await asyncio.to_thread(self._write_batch, batch)
+
+    def flush_sync(self) -> None:
+        batch = self._take_batch()
+        if batch:
+            self._write_batch(batch)
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _ensure_task(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except OSError:
+                logger.exception("Failed to write capture log %s", self.path)
+
+    def _take_batch(self) -> str:
+        if not self._pending:
+            return ""
+        lines = list(self._pending)
+        self._pending.clear()
+        self._pending_bytes = 0
+        if self._dropped:
+            lines.insert(0, f"== Log writer dropped {self._dropped} lines ==\n")
+            self._dropped = 0
+        return "".join(lines)
+
+    def _write_batch(self, batch: str) -> None:
+        if self._handle is None:
+            self._handle = open(self.path, "a", encoding="utf-8")
+        self._handle.write(batch)
+        self._handle.flush()
@@ -0,0 +1,195 @@
+import asyncio
+import dataclasses
+import datetime as dt
+import hashlib
+import logging
+import os
+import time
+from collections import deque
+from pathlib import Path
+
+from scripts.capture import CaptureManager, CaptureStatus
+from scripts.checksum import CHUNK_SIZE, SIDECAR_SUFFIX, sidecar_path
+from scripts.journal import CaptureJournal
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_PENDING = "pending"
+MIGRATION_COPYING = "copying"
+MIGRATION_VERIFYING = "verifying"
+MIGRATION_DONE = "done"
+MIGRATION_FAILED = "failed"
+
+
+@dataclasses.dataclass
+class Migration:
+    source: str
+    destination: str
+    capture_id: str | None
+    size: int
+    copied: int = 0
+    verified: int = 0
+    state: str = MIGRATION_PENDING
+    error: str | None = None
+    finished_at: dt.datetime | None = None
+
+
+class ArchiveMigrator:
+    def __init__(
+        self,
+        manager: CaptureManager,
+        staging_dir: str,
+        archive_dir: str,
+        bytes_per_second: float | None = None,
+    ) -> None:
+        self._manager = manager
+        self.staging_dir = staging_dir
+        self.archive_dir = archive_dir
+        self.bytes_per_second = bytes_per_second
+        self._pending: asyncio.Queue[Migration] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self._recent: deque[Migration] = deque(maxlen=100)
+        manager.add_listener(self._on_capture_end)
+
+    def start(self) -> None:
+        # Files left in staging by an earlier run that are not being
+        # recorded right now still need to be moved.
+        active = set()
+        for status in self._manager.statuses():
+            if status.running:
+                active.update(path for path in (status.output_file, status.proxy_file) if path)
+        staging = Path(self.staging_dir)
+        if staging.exists():
+            for file in sorted(staging.iterdir()):
+                if file.name.startswith(".") or not file.is_file() or str(file) in active:
+                    continue
+                if file.name.endswith(SIDECAR_SUFFIX):
+                    # Moved together with its recording unless that is already gone.
+                    if not (staging / file.name[: -len(SIDECAR_SUFFIX)]).exists():
+                        self.enqueue(str(file))
+                    continue
+                self.enqueue(str(file))
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def migrations(self) -> list[Migration]:
+        return list(self._recent)
+
+    def enqueue(self, source: str, capture_id: str | None = None) -> None:
+        for path in (source, str(sidecar_path(source))):
+            if not os.path.isfile(path):
+                continue
+            migration = Migration(
+                source=path,
+                destination=str(Path(self.archive_dir) / Path(path).name),
+                capture_id=capture_id,
+                size=os.path.getsize(path),
+            )
+            self._recent.append(migration)
+            self._pending.put_nowait(migration)
+
+    async def _run(self) -> None:
+        while True:
+            migration = await self._pending.get()
+            migration.state = MIGRATION_COPYING
+            try:
+                await asyncio.to_thread(self._migrate, migration)
+            except Exception as exc:
+                # The staged file is left in place; it is picked up again on
+                # the next start.
+                migration.state = MIGRATION_FAILED
+                migration.error = str(exc)
+                logger.exception("Moving %s to the archive failed", migration.source)
+                continue
+            migration.state = MIGRATION_DONE
+            migration.finished_at = dt.datetime.now()
+            logger.info("Moved %s to %s", migration.source, migration.destination)
+            journal = self._manager.journal
+            if journal is not None and migration.capture_id:
+                archived = archived_files(journal, migration.capture_id)
+                archived[Path(migration.source).name] = migration.destination
+                journal.update_metadata(migration.capture_id, {"archived": archived})
+
+    def _migrate(self, migration: Migration) -> None:
+        destination = Path(migration.destination)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Hidden until verified, so the recordings list never shows a partial copy.
+        partial = destination.with_name(f".{destination.name}.partial")
+        digest = copy_throttled(migration, partial, self.bytes_per_second)
+        expected = read_sidecar_digest(migration.source)
+        if expected is not None and expected != digest:
+            partial.unlink(missing_ok=True)
+            raise ValueError(f"{migration.source} does not match its checksum sidecar")
+        migration.state = MIGRATION_VERIFYING
+        if verify_throttled(migration, partial, self.bytes_per_second) != digest:
+            partial.unlink(missing_ok=True)
+            raise ValueError(f"Copy of {migration.source} failed verification")
+        # Keep the recording time, which the recordings list sorts by and the
+        # preview cache keys on.
+        stat = os.stat(migration.source)
+        os.utime(partial, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(partial, destination)
+        os.unlink(migration.source)
+
+    async def _on_capture_end(self, status: CaptureStatus) -> None:
+        for path in (status.output_file, status.proxy_file):
+            if path and Path(path).parent == Path(self.staging_dir):
+                self.enqueue(path, status.capture_id)
+
+
+def copy_throttled(migration: Migration, target: Path, bytes_per_second: float | None) -> str:
+    digest = hashlib.sha256()
+    started = time.monotonic()
+    with open(migration.source, "rb") as source, open(target, "wb") as handle:
+        while chunk := source.read(CHUNK_SIZE):
+            handle.write(chunk)
+            digest.update(chunk)
+            migration.copied += len(chunk)
+            throttle(migration.copied, started, bytes_per_second)
+        handle.flush()
+        os.fsync(handle.fileno())
+    return digest.hexdigest()
+
+
+def verify_throttled(migration: Migration, target: Path, bytes_per_second: float | None) -> str:
+    # Reading the copy back is as much load on the archive array as writing
+    # it, so it is held to the same rate.
+    digest = hashlib.sha256()
+    started = time.monotonic()
+    with open(target, "rb") as handle:
+        while chunk := handle.read(CHUNK_SIZE):
+            digest.update(chunk)
+            migration.verified += len(chunk)
+            throttle(migration.verified, started, bytes_per_second)
+    return digest.hexdigest()
+
+
+def throttle(done: int, started: float, bytes_per_second: float | None) -> None:
+    if bytes_per_second:
+        # Hold the average rate so neither the staging volume under live
+        # captures nor the archive array is saturated.
+        ahead = done / bytes_per_second - (time.monotonic() - started)
+        if ahead > 0:
+            time.sleep(ahead)
+
+
+def read_sidecar_digest(path: str) -> str | None:
+    try:
+        content = sidecar_path(path).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    return content.split()[0] if content.strip() else None
+
+
+def archived_files(journal: CaptureJournal, capture_id: str) -> dict:
+    entry = journal.get(capture_id)
+    return entry["metadata"].get("archived", {}) if entry else {}
@@ -0,0 +1,278 @@
+import asyncio
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from scripts.capture import CaptureManager, CaptureStatus, resolve_recording
+from scripts.journal import STATE_COMPLETED, STATE_STOPPED
+from scripts.priority import ProcessPriority
+from scripts.transcode import probe_media
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = ".cache/previews"
+
+POSTER_WIDTH = 480
+# Far enough in to be past the leader and blue screen of most tapes.
+POSTER_POSITION = 0.1
+SPRITE_TILES = 100
+SPRITE_COLUMNS = 10
+TILE_WIDTH = 160
+TILE_HEIGHT = 120
+MIN_TILE_INTERVAL_SECONDS = 10.0
+
+# Square pixels at the display aspect, so 4:3 and 16:9 tapes both look right.
+SQUARE_PIXELS = "yadif,scale='trunc(ih*dar/2)*2':ih,setsar=1"
+
+
+@dataclasses.dataclass
+class Preview:
+    poster: str
+    sprite: str
+    duration_seconds: float
+    interval_seconds: float
+    tiles: int
+    columns: int
+    tile_width: int
+    tile_height: int
+
+
+class PreviewCache:
+    def __init__(
+        self,
+        manager: CaptureManager,
+        output_dir: str,
+        staging_dir: str | None = None,
+        priority: ProcessPriority | None = None,
+    ) -> None:
+        self._manager = manager
+        self.output_dir = output_dir
+        self.staging_dir = staging_dir
+        self.cache_dir = Path(output_dir) / CACHE_DIR
+        self.priority = priority or manager.background_priority
+        self._pending: asyncio.Queue[str] = asyncio.Queue()
+        self._queued: set[str] = set()
+        # Keys of files that have no video or failed; not retried until the
+        # file changes or the service restarts.
+        self._failed: set[str] = set()
+        self._task: asyncio.Task | None = None
+        manager.add_listener(self._on_capture_end)
+
+    def start(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def lookup(self, name: str) -> Preview | None:
+        # Cached previews are returned as they are; a recording without one
+        # is queued so it has one next time.
+        source = resolve_recording(name, self.output_dir, self.staging_dir)
+        if source is None:
+            return None
+        key = cache_key(source)
+        if key is None:
+            return None
+        try:
+            data = json.loads((self.cache_dir / f"{key}.json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            self.enqueue(source.name)
+            return None
+        return Preview(**data)
+
+    def enqueue(self, name: str) -> None:
+        if name in self._queued:
+            return
+        self._queued.add(name)
+        self._pending.put_nowait(name)
+
+    def path(self, filename: str) -> Path | None:
+        safe_name = os.path.basename(filename)
+        if not safe_name or safe_name.startswith("."):
+            return None
+        path = self.cache_dir / safe_name
+        return path if path.is_file() else None
+
+    async def _run(self) -> None:
+        while True:
+            name = await self._pending.get()
+            try:
+                await self._generate(name)
+            except Exception:
+                logger.exception("Generating previews for %s failed", name)
+            finally:
+                self._queued.discard(name)
+
+    async def _generate(self, name: str) -> None:
+        source = resolve_recording(name, self.output_dir, self.staging_dir)
+        if source is None or str(source) in self._recording_now():
+            return
+        key = cache_key(source)
+        if key is None or key in self._failed or (self.cache_dir / f"{key}.json").exists():
+            return
+        try:
+            fd = os.open(source, os.O_RDONLY)
+        except FileNotFoundError:
+            # Moved out of staging meanwhile; the archived copy has the same
+            # key and is picked up by the next listing.
+            return
+        work_dir = self.cache_dir / f".{key}.tmp"
+        try:
+            # Every ffmpeg reads the file through this descriptor, so a
+            # migration that unlinks the staged copy mid-way cannot cut the
+            # sprite short.
+            held = f"/proc/self/fd/{fd}"
+            media = await probe_media(held, pass_fds=(fd,))
+            if media is None or not media.has_video or media.duration_seconds <= 0:
+                self._failed.add(key)
+                return
+            work_dir.mkdir(parents=True, exist_ok=True)
+            preview = await self._render(held, fd, key, media.duration_seconds, work_dir)
+            if preview is None:
+                self._failed.add(key)
+                return
+            for file in (preview.poster, preview.sprite):
+                os.replace(work_dir / file, self.cache_dir / file)
+            # Written last: its presence marks the entry complete.
+            (work_dir / "preview.json").write_text(json.dumps(dataclasses.asdict(preview)), encoding="utf-8")
+            os.replace(work_dir / "preview.json", self.cache_dir / f"{key}.json")
+        finally:
+            os.close(fd)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        logger.info("Cached previews for %s", name)
+
+    async def _render(self, source: str, fd: int, key: str, duration: float, work_dir: Path) -> Preview | None:
+        # Every frame is reached by seeking the input and decoding from there,
+        # so a two-hour master costs a hundred short decodes, not a full pass.
+        poster = f"{key}_poster.jpg"
+        if not await self._ffmpeg(
+            build_frame_command(
+                source, str(work_dir / poster), duration * POSTER_POSITION, f"{SQUARE_PIXELS},scale={POSTER_WIDTH}:-2"
+            ),
+            fd,
+        ):
+            return None
+        interval = max(duration / SPRITE_TILES, MIN_TILE_INTERVAL_SECONDS)
+        count = max(min(SPRITE_TILES, int(duration / interval)), 1)
+        tile_filter = (
+            f"{SQUARE_PIXELS},scale={TILE_WIDTH}:{TILE_HEIGHT}:force_original_aspect_ratio=decrease,"
+            f"pad={TILE_WIDTH}:{TILE_HEIGHT}:(ow-iw)/2:(oh-ih)/2"
+        )
+        tiles = 0
+        for index in range(count):
+            tile = work_dir / f"tile_{index:04d}.jpg"
+            # Sampled mid-interval so tile n stands for [n, n+1) intervals.
+            if not await self._ffmpeg(build_frame_command(source, str(tile), (index + 0.5) * interval, tile_filter), fd):
+                break
+            tiles += 1
+        if not tiles:
+            return None
+        sprite = f"{key}_sprite.jpg"
+        columns = min(SPRITE_COLUMNS, tiles)
+        rows = -(-tiles // columns)
+        if not await self._ffmpeg(build_sprite_command(str(work_dir / "tile_%04d.jpg"), str(work_dir / sprite), columns, rows)):
+            return None
+        return Preview(
+            poster=poster,
+            sprite=sprite,
+            duration_seconds=duration,
+            interval_seconds=interval,
+            tiles=tiles,
+            columns=columns,
+            tile_width=TILE_WIDTH,
+            tile_height=TILE_HEIGHT,
+        )
+
+    async def _ffmpeg(self, cmd: list[str], fd: int | None = None) -> bool:
+        process = await asyncio.create_subprocess_exec(
+            *self.priority.wrap(cmd),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=(fd,) if fd is not None else (),
+        )
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            logger.warning("Preview ffmpeg failed: %s", stderr.decode("utf-8", errors="replace").strip()[-500:])
+            return False
+        return os.path.exists(cmd[-1])
+
+    def _recording_now(self) -> set[str]:
+        # A file still being written would be cached under a size that is
+        # already out of date.
+        active = set()
+        for status in self._manager.statuses():
+            if status.running:
+                active.update(path for path in (status.output_file, status.proxy_file) if path)
+        return active
+
+    async def _on_capture_end(self, status: CaptureStatus) -> None:
+        if status.state in {STATE_COMPLETED, STATE_STOPPED} and status.output_file:
+            self.enqueue(Path(status.output_file).name)
+
+
+def cache_key(path: Path) -> str | None:
+    # Name, size and modification time identify the file's content well
+    # enough, and a re-recorded or edited file gets new previews.
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    identity = f"{path.name}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:24]
+
+
+def build_frame_command(source: str, output: str, seconds: float, video_filter: str) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-nostats",
+        "-y",
+        "-ss",
+        f"{seconds:.3f}",
+        "-i",
+        source,
+        "-map",
+        "0:v:0",
+        "-frames:v",
+        "1",
+        "-vf",
+        video_filter,
+        "-q:v",
+        "4",
+        output,
+    ]
+
+
+def build_sprite_command(tile_pattern: str, output: str, columns: int, rows: int) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-nostats",
+        "-y",
+        "-i",
+        tile_pattern,
+        "-vf",
+        f"tile={columns}x{rows}",
+        "-frames:v",
+        "1",
+        "-q:v",
+        "4",
+        output,
+    ]
@@ -0,0 +1,76 @@
+import dataclasses
+import os
+
+IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+
+@dataclasses.dataclass(frozen=True)
+class ProcessPriority:
+    cpus: frozenset[int] | None = None
+    nice: int | None = None
+    ionice_class: str | None = None
+    ionice_level: int | None = None
+
+    @classmethod
+    def from_settings(cls, cpus: str = "", nice: str = "", ionice: str = "") -> "ProcessPriority":
+        # ionice is "<class>[:<level>]", e.g. "best-effort:0" or "idle".
+        ionice_class, _, ionice_level = ionice.partition(":")
+        if ionice_class and ionice_class not in IONICE_CLASSES:
+            raise ValueError(f"Unknown ionice class {ionice_class!r}.")
+        return cls(
+            cpus=parse_cpu_set(cpus) if cpus else None,
+            nice=int(nice) if nice else None,
+            ionice_class=ionice_class or None,
+            ionice_level=int(ionice_level) if ionice_level else None,
+        )
+
+    def wrap(self, cmd: list[str]) -> list[str]:
+        # Each tool sets its attribute and execs the next, so the pid we spawn
+        # ends up as ffmpeg itself, and nothing runs between fork and exec in
+        # this (threaded) process.
+        prefix: list[str] = []
+        cpus = self.allowed_cpus()
+        if cpus:
+            prefix.extend(["taskset", "-c", ",".join(str(cpu) for cpu in cpus)])
+        if self.nice is not None:
+            # A nice it may not set (negative without CAP_SYS_NICE) is
+            # reported by nice(1), which still runs the command.
+            prefix.extend(["nice", "-n", str(self.nice)])
+        if self.ionice_class is not None:
+            # -t: still run the command if the I/O class cannot be set (e.g. the
+            # realtime class without CAP_SYS_ADMIN).
+            prefix.extend(["ionice", "-t", "-c", IONICE_CLASSES[self.ionice_class]])
+            if self.ionice_level is not None and self.ionice_class != "idle":
+                prefix.extend(["-n", str(self.ionice_level)])
+        return prefix + cmd
+
+    def allowed_cpus(self) -> list[int]:
+        # taskset fails instead of running the command when given CPUs the
+        # container may not use, so those are left out.
+        if not self.cpus:
+            return []
+        try:
+            allowed = os.sched_getaffinity(0)
+        except OSError:
+            return sorted(self.cpus)
+        return sorted(self.cpus & allowed)
+
+    def describe(self) -> dict:
+        return {
+            "cpus": sorted(self.cpus) if self.cpus else None,
+            "nice": self.nice,
+            "ionice_class": self.ionice_class,
+            "ionice_level": self.ionice_level,
+        }
+
+
+def parse_cpu_set(value: str) -> frozenset[int]:
+    # Same syntax as taskset/cpuset: "0-3,6,8-9".
+    cpus: set[int] = set()
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        cpus.update(range(int(start), int(end or start) + 1))
+    return frozenset(cpus)
@@ -0,0 +1,158 @@
+import asyncio
+import dataclasses
+import datetime as dt
+import heapq
+import logging
+import uuid
+
+from scripts.capture import CaptureOptions, options_from_dict
+from scripts.deck_queue import DeckQueue
+from scripts.journal import CaptureJournal
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on a single sleep so wall-clock jumps (NTP, suspend) are noticed.
+MAX_SLEEP_SECONDS = 60.0
+
+
+@dataclasses.dataclass
+class ScheduledCapture:
+    schedule_id: str
+    options: CaptureOptions
+    run_at: dt.datetime
+    repeat_seconds: int | None = None
+
+
+class CaptureScheduler:
+    def __init__(
+        self,
+        deck_queue: DeckQueue,
+        journal: CaptureJournal | None = None,
+        misfire_grace_seconds: int = 600,
+    ) -> None:
+        self._deck_queue = deck_queue
+        self._journal = journal
+        self.misfire_grace_seconds = misfire_grace_seconds
+        self._schedules: dict[str, ScheduledCapture] = {}
+        # One timer for all schedules: a heap ordered by due time, with
+        # stale entries (cancelled or rescheduled) skipped when popped.
+        self._heap: list[tuple[float, str]] = []
+        self._changed: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._changed = asyncio.Event()
+        if self._journal is not None:
+            for entry in self._journal.schedules():
+                schedule = ScheduledCapture(
+                    schedule_id=entry["schedule_id"],
+                    options=options_from_dict(entry["options"]),
+                    run_at=local_time(entry["run_at"]),
+                    repeat_seconds=entry["repeat_seconds"],
+                )
+                self._schedules[schedule.schedule_id] = schedule
+                heapq.heappush(self._heap, (schedule.run_at.timestamp(), schedule.schedule_id))
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def schedules(self) -> list[ScheduledCapture]:
+        return sorted(self._schedules.values(), key=lambda schedule: schedule.run_at)
+
+    def add(
+        self,
+        options: CaptureOptions,
+        run_at: dt.datetime,
+        repeat_seconds: int | None = None,
+    ) -> ScheduledCapture:
+        if repeat_seconds is not None and repeat_seconds <= 0:
+            raise ValueError("Repeat interval must be positive.")
+        schedule = ScheduledCapture(
+            schedule_id=uuid.uuid4().hex[:12],
+            options=options,
+            run_at=local_time(run_at),
+            repeat_seconds=repeat_seconds,
+        )
+        self._store(schedule)
+        return schedule
+
+    def cancel(self, schedule_id: str) -> tuple[bool, str]:
+        schedule = self._schedules.pop(schedule_id, None)
+        if schedule is None:
+            return False, f"Schedule {schedule_id} not found."
+        if self._journal is not None:
+            self._journal.delete_schedule(schedule_id)
+        return True, f"Schedule {schedule_id} cancelled."
+
+    def _store(self, schedule: ScheduledCapture) -> None:
+        self._schedules[schedule.schedule_id] = schedule
+        if self._journal is not None:
+            self._journal.save_schedule(
+                schedule.schedule_id,
+                dataclasses.asdict(schedule.options),
+                schedule.run_at,
+                schedule.repeat_seconds,
+            )
+        heapq.heappush(self._heap, (schedule.run_at.timestamp(), schedule.schedule_id))
+        if self._changed is not None:
+            self._changed.set()
+
+    async def _run(self) -> None:
+        assert self._changed is not None
+        while True:
+            now = dt.datetime.now().timestamp()
+            while self._heap and self._heap[0][0] <= now:
+                due_at, schedule_id = heapq.heappop(self._heap)
+                schedule = self._schedules.get(schedule_id)
+                if schedule is None or schedule.run_at.timestamp() != due_at:
+                    continue
+                try:
+                    await self._fire(schedule, now)
+                except Exception:
+                    # Only bookkeeping can fail here; the timer must keep
+                    # running for every other schedule.
+                    logger.exception("Schedule %s could not be rescheduled", schedule_id)
+            timeout = MAX_SLEEP_SECONDS
+            if self._heap:
+                timeout = min(max(self._heap[0][0] - now, 0.0), MAX_SLEEP_SECONDS)
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, schedule: ScheduledCapture, now: float) -> None:
+        late = now - schedule.run_at.timestamp()
+        if late > self.misfire_grace_seconds:
+            logger.warning("Schedule %s missed its start by %d s; skipping", schedule.schedule_id, late)
+        else:
+            try:
+                # Unattended runs rely on the tape being loaded ahead of time.
+                job = await self._deck_queue.enqueue(schedule.options, ready=True)
+            except Exception:
+                # A failed run still counts: a repeating schedule moves on to
+                # its next time and a one-shot one is removed below.
+                logger.exception("Schedule %s failed to queue its capture", schedule.schedule_id)
+            else:
+                logger.info("Schedule %s queued job %s", schedule.schedule_id, job.job_id)
+        if schedule.repeat_seconds is None:
+            self._schedules.pop(schedule.schedule_id, None)
+            if self._journal is not None:
+                self._journal.delete_schedule(schedule.schedule_id)
+            return
+        run_at = schedule.run_at
+        while run_at.timestamp() <= now:
+            run_at += dt.timedelta(seconds=schedule.repeat_seconds)
+        schedule.run_at = run_at
+        self._store(schedule)
+
+
+def local_time(value: dt.datetime) -> dt.datetime:
+    # Schedules are compared and fired in naive local time; an offset in the
+    # input (e.g. "Z" from a browser or script) is converted, not kept.
+    if value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
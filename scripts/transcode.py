@@ -0,0 +1,495 @@
+import asyncio
+import dataclasses
+import datetime as dt
+import json
+import logging
+import math
+import os
+import shutil
+import signal
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Callable
+
+from scripts.capture import (
+    CaptureManager,
+    CaptureStatus,
+    ProgressParser,
+    iter_stream_lines,
+    proxy_audio_flags,
+    proxy_flags,
+    proxy_video_flags,
+    resolve_recording,
+)
+from scripts.journal import STATE_COMPLETED, STATE_STOPPED
+from scripts.priority import ProcessPriority
+from scripts.tuning import available_cores
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+LOG_LINES = 500
+# Finished jobs kept for the status API; older ones are forgotten.
+RECENT_JOBS = 100
+
+# Shorter chunks are not worth an extra process and concat boundary.
+MIN_CHUNK_SECONDS = 120
+# Derivatives whose video can be encoded in time ranges and joined.
+CHUNKED_KINDS = {"h264_proxy"}
+
+
+@dataclasses.dataclass(frozen=True)
+class Derivative:
+    suffix: str
+    # Presets whose captures get this derivative automatically.
+    presets: frozenset[str]
+    flags: Callable[[], list[str]]
+
+
+DERIVATIVES = {
+    "h264_proxy": Derivative(
+        suffix="_proxy.mp4",
+        presets=frozenset({"archival_lossless"}),
+        flags=lambda: ["-map", "0:v:0", "-map", "0:a?"] + proxy_flags(),
+    ),
+    "mp4_remux": Derivative(
+        suffix=".mp4",
+        presets=frozenset({"high_quality_h264"}),
+        flags=lambda: ["-map", "0", "-c", "copy", "-movflags", "+faststart"],
+    ),
+    "audio_only": Derivative(
+        suffix="_audio.flac",
+        presets=frozenset({"archival_lossless", "archival_with_proxy", "high_quality_h264"}),
+        flags=lambda: ["-vn", "-map", "0:a:0", "-c:a", "flac"],
+    ),
+}
+
+
+@dataclasses.dataclass
+class TranscodeJob:
+    job_id: str
+    kind: str
+    source: str
+    output: str
+    capture_id: str | None
+    duration_seconds: float | None
+    created_at: dt.datetime
+    state: str = JOB_PENDING
+    started_at: dt.datetime | None = None
+    finished_at: dt.datetime | None = None
+    progress_seconds: float = 0.0
+    chunks: int = 1
+    return_code: int | None = None
+    error: str | None = None
+    log: deque[str] = dataclasses.field(default_factory=lambda: deque(maxlen=LOG_LINES), repr=False)
+    chunk_progress: dict[int, float] = dataclasses.field(default_factory=dict, repr=False)
+
+
+class TranscodePool:
+    def __init__(
+        self,
+        manager: CaptureManager,
+        output_dir: str,
+        staging_dir: str | None = None,
+        workers: int = 1,
+        kinds: tuple[str, ...] = ("h264_proxy",),
+        priority: ProcessPriority | None = None,
+    ) -> None:
+        self._manager = manager
+        self.output_dir = output_dir
+        self.staging_dir = staging_dir
+        self.workers = max(workers, 1)
+        self.kinds = kinds
+        self.priority = priority or manager.background_priority
+        # Waiting and running jobs by id; waiting ones also in start order.
+        self._jobs: dict[str, TranscodeJob] = {}
+        self._pending: deque[TranscodeJob] = deque()
+        self._recent: deque[TranscodeJob] = deque(maxlen=RECENT_JOBS)
+        self._processes: dict[str, list[asyncio.subprocess.Process]] = {}
+        self._wakeup = asyncio.Condition()
+        self._tasks: list[asyncio.Task] = []
+        manager.add_listener(self._on_capture_end)
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for processes in self._processes.values():
+            for process in processes:
+                process.send_signal(signal.SIGTERM)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def jobs(self) -> list[TranscodeJob]:
+        return sorted([*self._recent, *self._jobs.values()], key=lambda job: job.created_at)
+
+    def get(self, job_id: str) -> TranscodeJob | None:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        return next((job for job in self._recent if job.job_id == job_id), None)
+
+    async def enqueue(
+        self,
+        source: str,
+        kind: str,
+        capture_id: str | None = None,
+        duration_seconds: float | None = None,
+    ) -> TranscodeJob:
+        if kind not in DERIVATIVES:
+            raise ValueError(f"Unknown derivative {kind!r}.")
+        name = Path(source).name
+        job = TranscodeJob(
+            job_id=uuid.uuid4().hex[:12],
+            kind=kind,
+            source=name,
+            output=derivative_name(name, kind),
+            capture_id=capture_id,
+            duration_seconds=duration_seconds,
+            created_at=dt.datetime.now(),
+        )
+        if job.output == job.source:
+            raise ValueError(f"{name} is already a {kind} file.")
+        async with self._wakeup:
+            self._jobs[job.job_id] = job
+            self._pending.append(job)
+            self._wakeup.notify()
+        return job
+
+    async def cancel(self, job_id: str) -> tuple[bool, str]:
+        job = self.get(job_id)
+        if job is None:
+            return False, f"Transcode job {job_id} not found."
+        if job.state == JOB_PENDING:
+            job.state = JOB_CANCELLED
+            self._pending.remove(job)
+            self._finish(job)
+            return True, f"Transcode job {job_id} cancelled."
+        if job.state == JOB_RUNNING:
+            job.state = JOB_CANCELLED
+            for process in self._processes.get(job_id, []):
+                if process.returncode is None:
+                    process.send_signal(signal.SIGTERM)
+            return True, f"Cancelling transcode job {job_id}."
+        return False, f"Transcode job {job_id} already {job.state}."
+
+    async def _on_capture_end(self, status: CaptureStatus) -> None:
+        if status.state not in {STATE_COMPLETED, STATE_STOPPED} or not status.output_file:
+            return
+        duration = status.progress.out_time_seconds if status.progress is not None else None
+        for kind in self.kinds:
+            derivative = DERIVATIVES.get(kind)
+            if derivative is None or status.preset not in derivative.presets:
+                continue
+            # An .mp4 capture is its own mp4_remux; nothing to make.
+            if derivative_name(status.output_file, kind) == Path(status.output_file).name:
+                continue
+            await self.enqueue(status.output_file, kind, status.capture_id, duration or None)
+
+    async def _work(self) -> None:
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(self._has_pending)
+                job = self._pending.popleft()
+                job.state = JOB_RUNNING
+                job.started_at = dt.datetime.now()
+            try:
+                await self._run(job)
+            except Exception as exc:
+                logger.exception("Transcode job %s failed", job.job_id)
+                job.state = JOB_FAILED
+                job.error = str(exc)
+            self._finish(job)
+
+    def _has_pending(self) -> bool:
+        return bool(self._pending)
+
+    def _finish(self, job: TranscodeJob) -> None:
+        job.finished_at = dt.datetime.now()
+        self._jobs.pop(job.job_id, None)
+        self._recent.append(job)
+
+    async def _run(self, job: TranscodeJob) -> None:
+        # Resolved at start: the master may have moved from staging meanwhile.
+        source = resolve_recording(job.source, self.output_dir, self.staging_dir)
+        if source is None:
+            job.state = JOB_FAILED
+            job.error = f"{job.source} not found."
+            return
+        output = Path(self.output_dir) / job.output
+        if output.exists():
+            job.state = JOB_DONE
+            job.log.append(f"{output} already exists; nothing to do.")
+            return
+        # Hidden while incomplete so it does not show up as a recording.
+        partial = output.with_name(f".{output.name}")
+        try:
+            fd = os.open(source, os.O_RDONLY)
+        except FileNotFoundError:
+            # Moved out of staging between resolving and opening.
+            source = resolve_recording(job.source, self.output_dir, self.staging_dir)
+            if source is None:
+                job.state = JOB_FAILED
+                job.error = f"{job.source} not found."
+                return
+            fd = os.open(source, os.O_RDONLY)
+        try:
+            # Every ffmpeg reads the master through this descriptor, so a
+            # migration that unlinks the staged copy cannot pull it away from
+            # chunks that start later.
+            held = f"/proc/self/fd/{fd}"
+            job.log.append(f"Reading {source} as {held}")
+            ranges: list[tuple[float, float]] = []
+            media = None
+            if job.kind in CHUNKED_KINDS:
+                media = await probe_media(held, pass_fds=(fd,))
+                if media is not None:
+                    job.duration_seconds = job.duration_seconds or media.duration_seconds
+                    ranges = plan_chunks(media.duration_seconds, available_cores(self.priority.cpus))
+            if media is not None and len(ranges) > 1:
+                return_code = await self._run_chunked(job, held, fd, partial, ranges, media.has_audio)
+            else:
+                return_code = await self._run_ffmpeg(
+                    job, build_transcode_command(held, str(partial), job.kind), pass_fds=(fd,)
+                )
+        finally:
+            os.close(fd)
+        job.return_code = return_code
+        if job.state == JOB_CANCELLED or return_code != 0:
+            partial.unlink(missing_ok=True)
+            if job.state != JOB_CANCELLED:
+                job.state = JOB_FAILED
+                job.error = f"ffmpeg exited with {return_code}."
+            return
+        os.replace(partial, output)
+        job.state = JOB_DONE
+        logger.info("Transcode job %s wrote %s", job.job_id, output)
+
+    async def _run_chunked(
+        self,
+        job: TranscodeJob,
+        source: str,
+        fd: int,
+        partial: Path,
+        ranges: list[tuple[float, float]],
+        has_audio: bool,
+    ) -> int:
+        # Every frame of an archival master is a keyframe, so each time range
+        # decodes on its own: the video is encoded one process per range on
+        # separate cores, the audio once alongside, and the pieces are joined
+        # by stream copy.
+        job.chunks = len(ranges)
+        work_dir = partial.with_name(f"{partial.name}.chunks")
+        work_dir.mkdir(exist_ok=True)
+        try:
+            chunk_files = [work_dir / f"chunk_{index:04d}.mkv" for index in range(len(ranges))]
+            commands = [
+                build_chunk_command(source, str(chunk), start, length)
+                for chunk, (start, length) in zip(chunk_files, ranges)
+            ]
+            audio_file = work_dir / "audio.m4a"
+            if has_audio:
+                commands.append(build_audio_command(source, str(audio_file)))
+            codes = await asyncio.gather(
+                *(self._run_ffmpeg(job, cmd, index, pass_fds=(fd,)) for index, cmd in enumerate(commands))
+            )
+            failed = next((code for code in codes if code != 0), None)
+            if failed is not None or job.state == JOB_CANCELLED:
+                return failed if failed is not None else 0
+            chunk_list = work_dir / "chunks.ffconcat"
+            chunk_list.write_text(
+                "ffconcat version 1.0\n" + "".join(f"file '{chunk.name}'\n" for chunk in chunk_files),
+                encoding="utf-8",
+            )
+            return await self._run_ffmpeg(
+                job,
+                build_join_command(str(chunk_list), str(audio_file) if has_audio else None, str(partial)),
+                track_progress=False,
+            )
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def _run_ffmpeg(
+        self,
+        job: TranscodeJob,
+        cmd: list[str],
+        chunk: int = 0,
+        track_progress: bool = True,
+        pass_fds: tuple[int, ...] = (),
+    ) -> int:
+        job.log.append(" ".join(cmd))
+        process = await asyncio.create_subprocess_exec(
+            *self.priority.wrap(cmd),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=pass_fds,
+        )
+        self._processes.setdefault(job.job_id, []).append(process)
+        try:
+            await asyncio.gather(
+                self._read_log(job, process),
+                self._read_progress(job, process, chunk if track_progress else None),
+            )
+            return await process.wait()
+        finally:
+            if process.returncode is None:
+                process.kill()
+            processes = self._processes.get(job.job_id, [])
+            processes.remove(process)
+            if not processes:
+                self._processes.pop(job.job_id, None)
+
+    async def _read_log(self, job: TranscodeJob, process: asyncio.subprocess.Process) -> None:
+        assert process.stderr is not None
+        async for line in iter_stream_lines(process.stderr):
+            job.log.append(line)
+
+    async def _read_progress(self, job: TranscodeJob, process: asyncio.subprocess.Process, chunk: int | None) -> None:
+        assert process.stdout is not None
+        parser = ProgressParser()
+        async for line in iter_stream_lines(process.stdout):
+            progress = parser.feed(line)
+            if progress is not None and chunk is not None and chunk < job.chunks:
+                # Video chunks together cover the whole duration; the audio
+                # process running beside them is not counted.
+                job.chunk_progress[chunk] = progress.out_time_seconds
+                job.progress_seconds = sum(job.chunk_progress.values())
+
+
+@dataclasses.dataclass
+class MediaInfo:
+    duration_seconds: float
+    has_audio: bool
+    has_video: bool
+
+
+async def probe_media(path: str, pass_fds: tuple[int, ...] = ()) -> MediaInfo | None:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration:stream=codec_type",
+            "-of",
+            "json",
+            path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            pass_fds=pass_fds,
+        )
+    except FileNotFoundError:
+        logger.warning("ffprobe not available to probe %s", path)
+        return None
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    try:
+        info = json.loads(stdout)
+        duration = float(info["format"]["duration"])
+    except (ValueError, KeyError, TypeError):
+        return None
+    types = {stream.get("codec_type") for stream in info.get("streams", [])}
+    return MediaInfo(duration, "audio" in types, "video" in types)
+
+
+def plan_chunks(duration_seconds: float, cores: int) -> list[tuple[float, float]]:
+    count = min(cores, math.floor(duration_seconds / MIN_CHUNK_SECONDS))
+    if count <= 1:
+        return [(0.0, duration_seconds)]
+    length = duration_seconds / count
+    # The last range runs to the end so rounding cannot cut off frames.
+    return [(index * length, length if index < count - 1 else duration_seconds) for index in range(count)]
+
+
+def derivative_name(source: str, kind: str) -> str:
+    return Path(source).stem + DERIVATIVES[kind].suffix
+
+
+def build_transcode_command(source: str, output: str, kind: str) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "info",
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        "-y",
+        "-i",
+        source,
+        *DERIVATIVES[kind].flags(),
+        output,
+    ]
+
+
+def build_chunk_command(source: str, output: str, start: float, length: float) -> list[str]:
+    # -ss before -i seeks the input; with an intra-only master that lands
+    # exactly on the first frame of the range.
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "info",
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        "-y",
+        "-ss",
+        f"{start:.3f}",
+        "-i",
+        source,
+        "-t",
+        f"{length:.3f}",
+        "-map",
+        "0:v:0",
+        "-an",
+        # One core per chunk; the parallelism comes from the chunks.
+        "-threads:v",
+        "1",
+        *proxy_video_flags(),
+        output,
+    ]
+
+
+def build_audio_command(source: str, output: str) -> list[str]:
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "info",
+        "-nostats",
+        "-y",
+        "-i",
+        source,
+        "-vn",
+        "-map",
+        "0:a:0",
+        *proxy_audio_flags(),
+        output,
+    ]
+
+
+def build_join_command(chunk_list: str, audio_file: str | None, output: str) -> list[str]:
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "info", "-nostats", "-y", "-f", "concat", "-safe", "0", "-i", chunk_list]
+    if audio_file is not None:
+        cmd.extend(["-i", audio_file, "-map", "0:v", "-map", "1:a"])
+    return cmd + ["-c", "copy", "-movflags", "+faststart", output]
+
+
+def parse_kinds(value: str) -> tuple[str, ...]:
+    kinds = tuple(kind.strip() for kind in value.split(",") if kind.strip())
+    unknown = [kind for kind in kinds if kind not in DERIVATIVES]
+    if unknown:
+        raise ValueError(f"Unknown derivative(s): {', '.join(unknown)}.")
+    return kinds
@@ -0,0 +1,142 @@
+import dataclasses
+import math
+import os
+import re
+
+from scripts.devices import InputProfile
+
+QUEUE_BLOCKING_PATTERN = re.compile(r"Thread message queue blocking; consider raising the thread_queue_size")
+
+BYTES_PER_PIXEL = {
+    "yuyv422": 2.0,
+    "uyvy422": 2.0,
+    "nv12": 1.5,
+    "yuv420p": 1.5,
+    # Compressed; a rough upper bound for SD MJPEG frames.
+    "mjpeg": 0.5,
+}
+
+# Seconds of input each preset should be able to absorb while its encoder
+# or the disk briefly falls behind. Heavier encoders stall for longer.
+BUFFER_SECONDS = {
+    "archival_lossless": 4.0,
+    "archival_with_proxy": 6.0,
+    "high_quality_h264": 4.0,
+    "passthrough_if_possible": 2.0,
+}
+
+# ALSA delivers roughly one period per packet: ~1024 stereo s16 frames.
+AUDIO_PACKETS_PER_SECOND = 50
+AUDIO_PACKET_BYTES = 4096
+
+MIN_QUEUE_PACKETS = 32
+MAX_PRESSURE_LEVEL = 3
+
+
+@dataclasses.dataclass
+class QueuePlan:
+    video_packets: int
+    audio_packets: int
+    video_packet_bytes: int
+    pressure_level: int
+
+    @property
+    def buffer_bytes(self) -> int:
+        # Memory held if both queues fill up completely.
+        return self.video_packets * self.video_packet_bytes + self.audio_packets * AUDIO_PACKET_BYTES
+
+
+def frame_bytes(profile: InputProfile | None) -> int:
+    if profile is None:
+        return 720 * 480 * 2
+    width, _, height = profile.video_size.partition("x")
+    return int(int(width) * int(height) * BYTES_PER_PIXEL.get(profile.input_format, 2.0))
+
+
+def frame_rate(profile: InputProfile | None) -> float:
+    if profile is None:
+        return 30000 / 1001
+    numerator, _, denominator = profile.framerate.partition("/")
+    return float(numerator) / float(denominator or 1)
+
+
+def plan_queues(
+    profile: InputProfile | None,
+    preset: str,
+    pressure_level: int = 0,
+    memory_budget_bytes: int = 512 * 1024 * 1024,
+) -> QueuePlan:
+    # Each level of observed queue pressure doubles the buffered time, up to
+    # the per-capture memory budget.
+    level = min(max(pressure_level, 0), MAX_PRESSURE_LEVEL)
+    seconds = BUFFER_SECONDS.get(preset, 4.0) * 2**level
+    packet_bytes = frame_bytes(profile)
+    video_packets = math.ceil(frame_rate(profile) * seconds)
+    audio_budget = AUDIO_PACKETS_PER_SECOND * seconds * 2 * AUDIO_PACKET_BYTES
+    video_limit = max(int((memory_budget_bytes - audio_budget) // packet_bytes), MIN_QUEUE_PACKETS)
+    return QueuePlan(
+        video_packets=max(min(video_packets, video_limit), MIN_QUEUE_PACKETS),
+        audio_packets=max(math.ceil(AUDIO_PACKETS_PER_SECOND * seconds * 2), MIN_QUEUE_PACKETS),
+        video_packet_bytes=packet_bytes,
+        pressure_level=level,
+    )
+
+
+def next_pressure_level(level: int, blocking_warnings: int) -> int:
+    if blocking_warnings:
+        return min(level + 1, MAX_PRESSURE_LEVEL)
+    return max(level - 1, 0)
+
+
+# FFV1 version 3 only accepts slice counts that tile the frame evenly.
+FFV1_SLICE_COUNTS = (4, 6, 9, 12, 16, 24, 30)
+
+
+@dataclasses.dataclass
+class EncoderThreads:
+    cores: int
+    threads: int
+    slices: int | None = None
+    proxy_threads: int | None = None
+
+
+def available_cores(cpus: frozenset[int] | None = None) -> int:
+    if cpus:
+        return len(cpus)
+    return len(os.sched_getaffinity(0))
+
+
+def plan_encoder_threads(
+    preset: str,
+    cores: int,
+    active_captures: int,
+    capture_slots: int = 1,
+) -> EncoderThreads | None:
+    # Threads are fixed for a capture's lifetime, so the cores are split by
+    # how many captures are expected to run side by side, not by how many
+    # happen to run now; otherwise the first deck takes every core and the
+    # ones started after it oversubscribe them. Each gets at least one.
+    share = max(cores // max(capture_slots, active_captures + 1), 1)
+    if preset == "archival_lossless":
+        return EncoderThreads(cores=share, threads=share, slices=ffv1_slices(share))
+    if preset == "archival_with_proxy":
+        # The 360p proxy needs far less than the lossless master.
+        proxy_threads = max(share // 4, 1)
+        master_threads = max(share - proxy_threads, 1)
+        return EncoderThreads(
+            cores=share,
+            threads=master_threads,
+            slices=ffv1_slices(master_threads),
+            proxy_threads=proxy_threads,
+        )
+    if preset == "passthrough_if_possible":
+        return None
+    return EncoderThreads(cores=share, threads=share)
+
+
+def ffv1_slices(threads: int) -> int:
+    # At least one slice per thread so every thread has work.
+    for count in FFV1_SLICE_COUNTS:
+        if count >= threads:
+            return count
+    return FFV1_SLICE_COUNTS[-1]
@@ -0,0 +1,104 @@
+import asyncio
+import dataclasses
+import os
+import threading
+from collections import deque
+
+READ_SIZE = 1024 * 1024
+
+
+@dataclasses.dataclass
+class WriteBufferStatus:
+    capacity_bytes: int
+    fill_bytes: int
+    peak_bytes: int
+    written_bytes: int
+    full_waits: int
+    error: str | None
+
+
+class PipeWriteBuffer:
+    # Sits between ffmpeg's output pipe and the file on disk. A reader thread
+    # keeps the pipe drained into a bounded in-memory buffer while a writer
+    # thread empties it to disk, so a disk that stalls for a few seconds only
+    # fills the buffer instead of blocking ffmpeg's muxer.
+
+    def __init__(self, read_fd: int, path: str, capacity_bytes: int) -> None:
+        self.path = path
+        self.capacity_bytes = max(capacity_bytes, READ_SIZE)
+        self.fill_bytes = 0
+        self.peak_bytes = 0
+        self.written_bytes = 0
+        self.full_waits = 0
+        self.error: str | None = None
+        self._read_fd = read_fd
+        self._chunks: deque[bytes] = deque()
+        self._condition = threading.Condition()
+        self._eof = False
+        self._reader = threading.Thread(target=self._read, name=f"pipe-reader-{read_fd}", daemon=True)
+        self._writer = threading.Thread(target=self._write, name=f"pipe-writer-{read_fd}", daemon=True)
+
+    def start(self) -> None:
+        self._reader.start()
+        self._writer.start()
+
+    async def wait(self) -> None:
+        await asyncio.to_thread(self._writer.join)
+
+    def _read(self) -> None:
+        try:
+            while chunk := os.read(self._read_fd, READ_SIZE):
+                with self._condition:
+                    if self.fill_bytes + len(chunk) > self.capacity_bytes:
+                        # Out of room: stop draining the pipe, which is what
+                        # ffmpeg would have run into without the buffer.
+                        self.full_waits += 1
+                        while self.fill_bytes + len(chunk) > self.capacity_bytes and self.error is None:
+                            self._condition.wait()
+                    if self.error is not None:
+                        break
+                    self._chunks.append(chunk)
+                    self.fill_bytes += len(chunk)
+                    self.peak_bytes = max(self.peak_bytes, self.fill_bytes)
+                    self._condition.notify_all()
+        finally:
+            os.close(self._read_fd)
+            with self._condition:
+                self._eof = True
+                self._condition.notify_all()
+
+    def _write(self) -> None:
+        try:
+            with open(self.path, "wb") as handle:
+                while True:
+                    with self._condition:
+                        while not self._chunks and not self._eof:
+                            self._condition.wait()
+                        if not self._chunks:
+                            break
+                        chunk = self._chunks.popleft()
+                    handle.write(chunk)
+                    with self._condition:
+                        self.fill_bytes -= len(chunk)
+                        self.written_bytes += len(chunk)
+                        self._condition.notify_all()
+        except OSError as exc:
+            # Closing the read end makes ffmpeg fail on its next write, the
+            # same as a failing disk would without the buffer.
+            with self._condition:
+                self.error = str(exc)
+                self._chunks.clear()
+                self.fill_bytes = 0
+                self._condition.notify_all()
+
+    def snapshot(self) -> WriteBufferStatus:
+        with self._condition:
+            return WriteBufferStatus(
+                capacity_bytes=self.capacity_bytes,
+                fill_bytes=self.fill_bytes,
+                peak_bytes=self.peak_bytes,
+                written_bytes=self.written_bytes,
+                full_waits=self.full_waits,
+                error=self.error,
+            )
+
@@ -0,0 +1,41 @@
+import asyncio
+import dataclasses
+import datetime as dt
+
+from scripts.capture import CaptureOptions
+from scripts.journal import CaptureJournal
+from scripts.scheduler import CaptureScheduler
+
+
+class IdleQueue:
+    async def enqueue(self, options, ready=False):
+        raise AssertionError("not due")
+
+
+def make_options() -> CaptureOptions:
+    required = {field.name: None for field in dataclasses.fields(CaptureOptions) if field.default is dataclasses.MISSING}
+    return CaptureOptions(**{**required, "video_device": "/dev/video0"})
+
+
+def test_aware_and_naive_start_times_are_stored_as_local_time(tmp_path):
+    async def scenario():
+        journal = CaptureJournal(str(tmp_path / "journal.sqlite3"))
+        scheduler = CaptureScheduler(IdleQueue(), journal)
+        scheduler.start()
+        naive = dt.datetime.now() + dt.timedelta(hours=2)
+        aware = (dt.datetime.now() + dt.timedelta(hours=1)).astimezone(dt.timezone.utc)
+        scheduler.add(make_options(), naive)
+        scheduler.add(make_options(), aware, 3600)
+        ordered = scheduler.schedules()
+        await scheduler.close()
+
+        reloaded = CaptureScheduler(IdleQueue(), journal)
+        reloaded.start()
+        reloaded_order = reloaded.schedules()
+        await reloaded.close()
+        return aware, naive, ordered, reloaded_order
+
+    aware, naive, ordered, reloaded = asyncio.run(scenario())
+    assert [schedule.run_at for schedule in ordered] == [aware.astimezone().replace(tzinfo=None), naive]
+    assert all(schedule.run_at.tzinfo is None for schedule in ordered + reloaded)
+    assert [schedule.run_at for schedule in reloaded] == [schedule.run_at for schedule in ordered]